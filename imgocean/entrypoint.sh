@@ -10,6 +10,19 @@ then
     echo "PostgreSQL started"
 fi
 
+# Run one-off commands, e.g. `docker compose run web python manage.py ...`
+if [ $# -gt 0 ]
+then
+    exec "$@"
+fi
+
+if [ "$SERVE_MODE" = "production" ]
+then
+    # Data is kept between deploys, only migrations are applied.
+    python manage.py migrate --no-input
+    exec gunicorn -c gunicorn.conf.py imgocean.wsgi
+fi
+
 python manage.py flush --no-input
 python manage.py migrate
 python manage.py loaddata fixtures.json
@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration of the production serve mode.
+
+The application is imported once by the master and forked into workers,
+which open their database connection and load cached tables before
+they accept any request.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(
+    os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+)
+# With more threads, each of them opens its own persistent connection.
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+accesslog = '-'
+
+
+def when_ready(server):
+    # Runs in the master before workers are forked.
+    if server.cfg.preload_app:
+        from ocean.warmup import warm_up_process
+        warm_up_process()
+
+
+def post_worker_init(worker):
+    # Runs in each worker once the application is loaded, before it
+    # starts accepting connections.
+    from ocean.warmup import warm_up_process, warm_up_worker
+    warm_up_process()
+    warm_up_worker()
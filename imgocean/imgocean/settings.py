@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ocean.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,6 +87,13 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'password'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Seconds connections are kept open between requests, set it
+        # to 0 behind PgBouncer, which pools connections on its own.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # Required with PgBouncer in transaction pooling mode.
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', 'false'
+        ).lower() == 'true',
     }
 }
 
@@ -141,12 +150,134 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'ocean.authentication.CachedJWTAuthentication',
     )
 }
 
+# In-process cache of users of JWT authenticated requests, TTL bounds how
+# long changes made by other processes take to show up
+AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', 10000))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
 }
 
-MEDIA_ROOT = 'images/'
\ No newline at end of file
+MEDIA_ROOT = 'images/'
+
+# Rendered thumbnails cache, set max bytes to 0 to disable it
+THUMBNAIL_CACHE_DIR = os.environ.get(
+    'THUMBNAIL_CACHE_DIR', BASE_DIR / 'thumbnails'
+)
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+)
+
+# Number of workers rendering thumbnails right after upload, 0 disables it
+THUMBNAIL_PREGENERATE_WORKERS = int(
+    os.environ.get('THUMBNAIL_PREGENERATE_WORKERS', 2)
+)
+
+# Thumbnails resampling, filter is a name of PIL.Image.Resampling member.
+# Reducing gap limits how close to the target size JPEG draft decoding
+# and integer reduce() shrink the original before the final resample.
+THUMBNAIL_RESAMPLE = os.environ.get('THUMBNAIL_RESAMPLE', 'LANCZOS')
+THUMBNAIL_REDUCING_GAP = float(
+    os.environ.get('THUMBNAIL_REDUCING_GAP', 3.0)
+)
+
+# Thumbnails are encoded in WebP for clients listing it in their Accept
+# header. Quality is 0-100, method 0-6 trades encoding speed for size.
+THUMBNAIL_WEBP = os.environ.get('THUMBNAIL_WEBP', 'true').lower() == 'true'
+THUMBNAIL_WEBP_QUALITY = int(os.environ.get('THUMBNAIL_WEBP_QUALITY', 80))
+THUMBNAIL_WEBP_METHOD = int(os.environ.get('THUMBNAIL_WEBP_METHOD', 4))
+
+# Seconds the in-process copy of the Size table is kept for
+SIZES_CACHE_TTL = int(os.environ.get('SIZES_CACHE_TTL', 60))
+
+# Delivery of original images: 'django' streams them with FileResponse,
+# 'x-accel-redirect' and 'x-sendfile' hand them over to the front proxy.
+# X-Accel-Redirect points to the internal proxy location of MEDIA_ROOT.
+IMAGE_SERVE_MODE = os.environ.get('IMAGE_SERVE_MODE', 'django')
+IMAGE_ACCEL_REDIRECT_LOCATION = os.environ.get(
+    'IMAGE_ACCEL_REDIRECT_LOCATION', '/protected/images/'
+)
+
+# Batch uploads limits
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get('UPLOAD_BATCH_MAX_FILES', 500))
+UPLOAD_VALIDATION_WORKERS = int(
+    os.environ.get('UPLOAD_VALIDATION_WORKERS', 4)
+)
+
+# Resumable upload sessions, partial files are kept in this directory
+# of MEDIA_ROOT
+UPLOAD_SESSION_DIR = 'uploads'
+UPLOAD_SESSION_MAX_BYTES = int(
+    os.environ.get('UPLOAD_SESSION_MAX_BYTES', 100 * 1024 * 1024)
+)
+UPLOAD_SESSION_MAX_CHUNK = int(
+    os.environ.get('UPLOAD_SESSION_MAX_CHUNK', 8 * 1024 * 1024)
+)
+
+# Number of threads rendering variants requested through async views
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 4))
+
+# Lock files coalescing renders of the same variant across worker
+# processes of a host, keys are spread over a fixed number of files
+RENDER_LOCK_DIR = os.environ.get(
+    'RENDER_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'imgocean-locks')
+)
+RENDER_LOCK_STRIPES = int(os.environ.get('RENDER_LOCK_STRIPES', 1024))
+
+# Images with more pixels are rejected at upload and never rendered
+IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 50_000_000))
+
+# Bytes of pixel buffers renders of one process may hold at once, renders
+# over the budget wait for others to finish, 0 disables the limit
+RENDER_MEMORY_BUDGET = int(
+    os.environ.get('RENDER_MEMORY_BUDGET', 512 * 1024 * 1024)
+)
+
+# Admission of cache-miss renders of each image owner in a process, used
+# for accounts without their own limits. Renders of async views over the
+# limits wait in a queue of at most QUEUE requests for up to TIMEOUT
+# seconds, the rest, and those of sync views, are answered with 503 and
+# Retry-After. 0 disables a limit.
+RENDER_ADMISSION_CONCURRENCY = int(
+    os.environ.get('RENDER_ADMISSION_CONCURRENCY', 2)
+)
+RENDER_ADMISSION_RATE = float(os.environ.get('RENDER_ADMISSION_RATE', 5))
+RENDER_ADMISSION_BURST = int(os.environ.get('RENDER_ADMISSION_BURST', 20))
+RENDER_ADMISSION_QUEUE = int(os.environ.get('RENDER_ADMISSION_QUEUE', 8))
+RENDER_ADMISSION_TIMEOUT = float(
+    os.environ.get('RENDER_ADMISSION_TIMEOUT', 2)
+)
+
+# Storage of original images, 'ocean.storage.S3Storage' keeps them in S3
+# compatible object storage configured below
+DEFAULT_FILE_STORAGE = os.environ.get(
+    'DEFAULT_FILE_STORAGE', 'django.core.files.storage.FileSystemStorage'
+)
+# Optional storage of rendered variants shared by all nodes, kept behind
+# the local thumbnail cache
+VARIANT_STORAGE = os.environ.get('VARIANT_STORAGE')
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'http://localhost:9000')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'ocean')
+S3_ACCESS_KEY_ID = os.environ.get('S3_ACCESS_KEY_ID', '')
+S3_SECRET_ACCESS_KEY = os.environ.get('S3_SECRET_ACCESS_KEY', '')
+S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+S3_MAX_CONNECTIONS = int(os.environ.get('S3_MAX_CONNECTIONS', 10))
+S3_TIMEOUT = float(os.environ.get('S3_TIMEOUT', 10))
+S3_READ_CHUNK_SIZE = int(os.environ.get('S3_READ_CHUNK_SIZE', 1024 * 1024))
+S3_MULTIPART_THRESHOLD = int(
+    os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024)
+)
+S3_MULTIPART_CHUNK_SIZE = int(
+    os.environ.get('S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024)
+)
+
+# Request instrumentation, stage timings are returned in Server-Timing
+# headers when enabled and aggregated histograms are served at /metrics
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true'
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
@@ -15,8 +15,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from ocean.views import MetricsView, ReadinessView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('ocean.urls')),
+    path('metrics', MetricsView.as_view()),
+    path('ready', ReadinessView.as_view()),
 ]
@@ -0,0 +1,208 @@
+"""
+Admission control of thumbnail renders.
+
+Every image owner gets a token bucket and a concurrency limit of its
+account's tier in each process, so a single client can't keep all
+workers busy rendering its library. Renders of async views over the
+limits wait on the event loop in a short bounded queue, and are
+rejected once it's full or they waited too long. Sync views would wait
+holding their worker, so their renders are rejected right away.
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from django.conf import settings
+from .sizes import get_render_limits
+
+# Idle owners are forgotten once more than this many are tracked.
+MAX_TRACKED_OWNERS = 10000
+
+
+class RenderRejected(Exception):
+    def __init__(self, retry_after):
+        super().__init__('Too many renders, try again later.')
+        self.retry_after = retry_after
+
+    def get_retry_after(self):
+        """
+        Return value of the `Retry-After` header in whole seconds.
+        """
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class _OwnerState:
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+        self.active = 0
+        # (loop, future) of async renders waiting for their turn
+        self.waiters = []
+
+    def refill(self, rate, burst, now):
+        if rate:
+            self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def is_idle(self):
+        return not self.active and not self.waiters
+
+
+class AdmissionController:
+    """
+    Token bucket and concurrency limit per owner of the rendered images.
+
+    `admit(owner_id, limits)` returns context manager held for the time
+    of the render, which rejects it right away if the owner is over its
+    `limits`. They are `(concurrency, rate, burst)`, where 0 disables a
+    limit. Its async version `aadmit` lets the render wait up to
+    `timeout` seconds in a queue of at most `queue_size` renders.
+    """
+
+    def __init__(self, queue_size, timeout):
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._owners = {}
+
+    def _get_state(self, owner_id, burst, now):
+        state = self._owners.get(owner_id)
+        if state is None:
+            if len(self._owners) >= MAX_TRACKED_OWNERS:
+                self._forget_idle()
+            state = self._owners[owner_id] = _OwnerState(burst, now)
+        return state
+
+    def _forget_idle(self):
+        # Dropping a bucket refills it, which is harmless for owners
+        # that aren't rendering anything.
+        for owner_id, state in list(self._owners.items()):
+            if state.is_idle():
+                del self._owners[owner_id]
+
+    def _try_admit(self, owner_id, limits, now):
+        """
+        Take a token and a slot of the owner, returning its state, or
+        return `(wait, retry_after)` if it's over its limits, `wait` being
+        the time until its next token.
+
+        Must be called with the lock held.
+        """
+        concurrency, rate, burst = limits
+        burst = max(burst, 1)
+        state = self._get_state(owner_id, burst, now)
+        state.refill(rate, burst, now)
+        wait = (1 - state.tokens) / rate if rate and state.tokens < 1 else 0
+        free = not concurrency or state.active < concurrency
+        if free and not wait:
+            if rate:
+                state.tokens -= 1
+            state.active += 1
+            return state, None
+        # Without a free slot the time of the next one is unknown,
+        # a second is what a thumbnail render roughly takes.
+        return state, (wait, wait if free else max(wait, 1))
+
+    def _release(self, state):
+        with self._lock:
+            state.active -= 1
+            # Waiters for tokens and for slots are all woken to try again.
+            for loop, waiter in state.waiters:
+                loop.call_soon_threadsafe(_wake, waiter)
+
+    @contextmanager
+    def admit(self, owner_id, limits):
+        with self._lock:
+            state, rejected = self._try_admit(
+                owner_id, limits, time.monotonic()
+            )
+        if rejected is not None:
+            raise RenderRejected(rejected[1])
+        try:
+            yield
+        finally:
+            self._release(state)
+
+    @asynccontextmanager
+    async def aadmit(self, owner_id, limits):
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        deadline = now + self.timeout
+        while True:
+            with self._lock:
+                state, rejected = self._try_admit(owner_id, limits, now)
+                if rejected is None:
+                    break
+                wait, retry_after = rejected
+                if len(state.waiters) >= self.queue_size \
+                        or now + wait > deadline:
+                    raise RenderRejected(retry_after)
+                waiter = (loop, loop.create_future())
+                state.waiters.append(waiter)
+            try:
+                await asyncio.wait(
+                    [waiter[1]], timeout=min(wait or math.inf, deadline - now)
+                )
+            finally:
+                with self._lock:
+                    state.waiters.remove(waiter)
+            now = time.monotonic()
+            if now >= deadline:
+                raise RenderRejected(retry_after)
+        try:
+            yield
+        finally:
+            self._release(state)
+
+
+@lru_cache(maxsize=None)
+def _admission_controller(queue_size, timeout):
+    return AdmissionController(queue_size, timeout)
+
+
+def get_admission_controller():
+    """
+    Return admission controller configured in settings.
+    """
+    return _admission_controller(
+        settings.RENDER_ADMISSION_QUEUE,
+        settings.RENDER_ADMISSION_TIMEOUT
+    )
+
+
+def get_account_limits(account_id):
+    """
+    Return `(concurrency, rate, burst)` of the account, falling back to
+    `RENDER_ADMISSION_*` settings.
+    """
+    concurrency, rate, burst = get_render_limits(account_id)
+    return (
+        settings.RENDER_ADMISSION_CONCURRENCY if concurrency is None else concurrency,
+        settings.RENDER_ADMISSION_RATE if rate is None else rate,
+        settings.RENDER_ADMISSION_BURST if burst is None else burst,
+    )
+
+
+def admit_render(image):
+    """
+    Return context manager admitting render of the image's variant,
+    raising `RenderRejected` if the owner is over its account's limits.
+    """
+    return get_admission_controller().admit(
+        image.owner_id, get_account_limits(image.owner.account_type_id)
+    )
+
+
+def aadmit_render(image, limits):
+    """
+    Async version of `admit_render` with the owner's `limits` given, as
+    `get_account_limits` may query the database.
+    """
+    return get_admission_controller().aadmit(image.owner_id, limits)
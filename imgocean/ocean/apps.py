@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OceanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ocean'
+
+    def ready(self):
+        from . import signals  # noqa: F401
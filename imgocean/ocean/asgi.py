@@ -0,0 +1,70 @@
+"""
+ASGI handler streaming file responses without blocking the event loop.
+
+Django 4.0 iterates streaming responses synchronously on the event
+loop, so every block of a `FileResponse` is read there, with remote
+storage each block is an HTTP request. `AsyncFileResponse` blocks are
+read in threads by `ASGIHandler` instead.
+"""
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler as BaseASGIHandler
+from django.http import FileResponse
+
+
+class AsyncFileResponse(FileResponse):
+    """
+    `FileResponse` read in threads when it's sent by `ASGIHandler`.
+
+    Other handlers, like the WSGI one, iterate it as `FileResponse`.
+    """
+    # Each block read is a hop to a thread, so they are bigger.
+    block_size = 256 * 1024
+
+    async def __aiter__(self):
+        read = sync_to_async(self.file_to_stream.read, thread_sensitive=False)
+        while True:
+            block = await read(self.block_size)
+            if not block:
+                break
+            yield block
+
+
+class ASGIHandler(BaseASGIHandler):
+    async def send_response(self, response, send):
+        if not isinstance(response, AsyncFileResponse):
+            return await super().send_response(response, send)
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value
+            )
+            for header, value in response.items()
+        ]
+        for cookie in response.cookies.values():
+            headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        async for block in response:
+            for chunk, _ in self.chunk_bytes(block):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    """
+    Return ASGI callable of the project, see
+    `django.core.asgi.get_asgi_application`.
+    """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
@@ -0,0 +1,137 @@
+"""
+Async versions of image endpoints for ASGI servers.
+
+DRF views are synchronous, so these are plain Django views. Queries run
+through `sync_to_async`, which is how Django 4.0 talks to the database
+from async code, and rendering runs on the bounded render pool, so the
+event loop only waits for slow clients and I/O.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from .admission import RenderRejected, aadmit_render, get_account_limits
+from .authentication import CachedJWTAuthentication
+from .delivery import (
+    aget_original_response, get_response_format, get_validators,
+    get_variant_response, set_validators
+)
+from .links import ExpiredLink, InvalidLink, verify_link
+from .metrics import stage
+from .models import Image
+from .pagination import ImageKeysetPagination
+from .rendering import aget_or_render_variant, get_variant_options
+from .serializers import ImageDetailSerializer
+from .views import get_image_urls, get_sizes
+
+
+async def authenticate(request):
+    """
+    Return user of the request's JWT or anonymous user without one.
+    """
+    result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    if result is None:
+        return AnonymousUser()
+    return result[0]
+
+
+def unauthorized(e):
+    return JsonResponse({'detail': str(e.detail)}, status=401)
+
+
+async def image_list(request):
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405)
+    try:
+        user = await authenticate(request)
+    except AuthenticationFailed as e:
+        return unauthorized(e)
+    if user.is_anonymous:
+        return JsonResponse(
+            {'detail': 'Authentication credentials were not provided.'},
+            status=401
+        )
+
+    def get_page():
+        images = Image.objects.filter(owner=user).only(
+            'id', 'name', 'created_at'
+        )
+        sizes = get_sizes(user)
+        paginator = ImageKeysetPagination()
+        page = paginator.paginate_queryset(images, Request(request))
+        results = [get_image_urls(image, sizes) for image in page]
+        return {'next': paginator.get_next_link(), 'results': results}
+
+    try:
+        data = await sync_to_async(get_page)()
+    except Http404 as e:
+        return JsonResponse({'detail': str(e)}, status=404)
+    return JsonResponse(data)
+
+
+async def image_detail(request, filename):
+    if request.method != 'GET':
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405)
+    params = request.GET
+    signed = 'signature' in params
+    if signed:
+        try:
+            verify_link(
+                filename,
+                params.get('size', '0'),
+                params.get('expires'),
+                params['signature']
+            )
+        except InvalidLink as e:
+            return JsonResponse({'error': str(e)}, status=403)
+        except ExpiredLink as e:
+            return JsonResponse({'error': str(e)}, status=404)
+    try:
+        user = await authenticate(request)
+    except AuthenticationFailed as e:
+        return unauthorized(e)
+    query_serializer = ImageDetailSerializer(data=params)
+    if not query_serializer.is_valid():
+        return JsonResponse(query_serializer.errors, status=400)
+
+    def get_image():
+        image_record, size = query_serializer.get_image(
+            filename, user, signed=signed
+        )
+        # Anything read from the sizes cache is worked out here, as
+        # reloading it queries the database.
+        file_format = get_response_format(request, image_record, size)
+        options = limits = None
+        if size:
+            options = get_variant_options(image_record.img, size, file_format)
+            limits = get_account_limits(image_record.owner.account_type_id)
+        validators = get_validators(image_record, size, file_format, options)
+        return image_record, size, file_format, options, limits, validators
+
+    try:
+        with stage('lookup'):
+            image_record, size, file_format, options, limits, validators = \
+                await sync_to_async(get_image)()
+        etag, last_modified = validators
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None and not size:
+            response = await aget_original_response(image_record.img)
+        elif response is None:
+            data, file_format = await aget_or_render_variant(
+                image_record.img, size, file_format, options,
+                admission=aadmit_render(image_record, limits)
+            )
+            response = get_variant_response(data, file_format)
+        if size:
+            patch_vary_headers(response, ['Accept'])
+        return set_validators(response, etag, last_modified)
+    except RenderRejected as e:
+        response = JsonResponse({'error': str(e)}, status=503)
+        response['Retry-After'] = e.get_retry_after()
+        return response
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=400)
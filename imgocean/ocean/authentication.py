@@ -0,0 +1,102 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Bounded LRU of users with their accounts, entries expire at their
+    own time.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= time.time():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user, expires):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[user_id] = (user, expires)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+@lru_cache(maxsize=None)
+def _user_cache(max_entries):
+    return UserCache(max_entries)
+
+
+def get_user_cache():
+    """
+    Return cache of authenticated users configured in settings.
+    """
+    return _user_cache(settings.AUTH_CACHE_MAX_ENTRIES)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication resolving users with their accounts in a single
+    query, which is cached in process memory.
+
+    Users are cached until their token expires, but at most for
+    `AUTH_CACHE_TTL` seconds. Signals drop users and accounts changed
+    in this process, the TTL bounds how long changes made by other
+    processes take to show up.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        cache = get_user_cache()
+        # Claims are strings or integers depending on simplejwt version,
+        # while signals only know the field, so keys are always strings.
+        user = cache.get(str(user_id))
+        if user is None:
+            try:
+                user = self.user_model.objects.select_related(
+                    'account_type'
+                ).get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            expires = min(
+                validated_token.get('exp', float('inf')),
+                time.time() + settings.AUTH_CACHE_TTL
+            )
+            cache.set(str(user_id), user, expires)
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        # Requests get their own copy, which they are free to modify.
+        return copy.copy(user)
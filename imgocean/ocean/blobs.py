@@ -0,0 +1,153 @@
+"""
+Content-addressed storage of originals.
+
+Files are stored once per content under a name derived from their
+SHA-256 digest, and `Blob` rows count the images pointing at them. Image
+variants are cached by file name, so duplicates share them as well.
+"""
+import hashlib
+import os
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .cache import delete_shared_variants, get_thumbnail_cache
+from .models import Blob
+
+CHUNK_SIZE = 64 * 1024
+
+
+def get_digest(file):
+    """
+    Return SHA-256 hex digest of the file's content.
+    """
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def get_blob_name(digest, filename):
+    _, extension = os.path.splitext(filename)
+    return f'blobs/{digest[:2]}/{digest}{extension.lower()}'
+
+
+def acquire_blob(digest, filename, store, count=1):
+    """
+    Return blob of the content with `digest`, taking `count` references.
+
+    `store(name)` is called to store the content only when no blob has
+    it yet, and returns the name it was stored under. The blob row is
+    locked until the caller's transaction ends, so a concurrent release
+    can't delete it in the meantime.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(digest=digest).first()
+        if blob is None:
+            name = store(get_blob_name(digest, filename))
+            try:
+                with transaction.atomic():
+                    return Blob.objects.create(
+                        digest=digest, name=name, references=count
+                    )
+            except IntegrityError:
+                # Same content was stored concurrently, the file stored
+                # above is dropped in favour of the committed one.
+                blob = Blob.objects.select_for_update().get(digest=digest)
+                if name != blob.name:
+                    default_storage.delete(name)
+        Blob.objects.filter(pk=blob.pk).update(
+            references=F('references') + count
+        )
+    return blob
+
+
+def acquire_blobs(files):
+    """
+    Bulk version of `acquire_blob` for uploaded files.
+
+    `files` maps digests to `(file, count)` tuples. Blobs of new content
+    are created in a single insert. Return dict of blobs by digest.
+    """
+    with transaction.atomic():
+        blobs = {
+            blob.digest: blob
+            for blob in Blob.objects.select_for_update().filter(
+                digest__in=files
+            )
+        }
+        for digest, blob in blobs.items():
+            Blob.objects.filter(pk=blob.pk).update(
+                references=F('references') + files[digest][1]
+            )
+        created = [
+            Blob(
+                digest=digest,
+                name=default_storage.save(get_blob_name(digest, file.name), file),
+                references=count
+            )
+            for digest, (file, count) in files.items()
+            if digest not in blobs
+        ]
+        try:
+            with transaction.atomic():
+                Blob.objects.bulk_create(created)
+        except IntegrityError:
+            # Some content was stored concurrently, fall back to taking
+            # blobs one by one. Files stored above are reused for content
+            # still missing a blob, the others are dropped.
+            for blob in created:
+                file, count = files[blob.digest]
+                acquired = acquire_blob(
+                    blob.digest, file.name,
+                    lambda name, stored=blob.name: stored,
+                    count
+                )
+                if acquired.name != blob.name:
+                    default_storage.delete(blob.name)
+                blobs[blob.digest] = acquired
+            return blobs
+        blobs.update((blob.digest, blob) for blob in created)
+    return blobs
+
+
+def attach_blob(image, file):
+    """
+    Point the image at the blob of the uploaded file's content.
+    """
+    blob = acquire_blob(
+        get_digest(file), file.name,
+        lambda name: default_storage.save(name, file)
+    )
+    image.blob = blob
+    image.digest = blob.digest
+    image.img = blob.name
+
+
+def delete_files(name):
+    default_storage.delete(name)
+    get_thumbnail_cache().delete(name)
+    delete_shared_variants(name)
+
+
+def release_blob(image):
+    """
+    Drop the image's reference to its blob, deleting the blob with its
+    file and cached variants once the last reference is gone.
+
+    Return whether the blob was deleted.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(pk=image.blob_id).first()
+        if blob is None:
+            return False
+        if blob.references > 1:
+            Blob.objects.filter(pk=blob.pk).update(
+                references=F('references') - 1
+            )
+            return False
+        blob.delete()
+        # Files are deleted only once the rows are gone for good.
+        transaction.on_commit(lambda: delete_files(blob.name))
+    return True
@@ -0,0 +1,189 @@
+import os
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.core.files.base import ContentFile
+from .storage import variant_storage
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of rendered image variants with a byte budget.
+
+    Variants are stored as `<location>/<filename>/<height>.<format>`,
+    so all variants of one image can be dropped by removing a single
+    directory. Recency is tracked with file modification times, which
+    are bumped on every hit, and the least recently used variants are
+    evicted once the cache grows over `max_bytes`.
+    """
+    # Fraction of the budget the cache is trimmed down to on eviction,
+    # so that a full cache isn't rescanned on every single write.
+    LOW_WATERMARK = 0.9
+
+    def __init__(self, location, max_bytes):
+        self.location = str(location)
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _image_dir(self, filename):
+        return os.path.join(self.location, os.path.basename(filename))
+
+    def _variant_path(self, filename, height, file_format, profile):
+        return os.path.join(
+            self._image_dir(filename),
+            get_variant_basename(height, file_format, profile)
+        )
+
+    def get(self, filename, height, file_format, profile=''):
+        """
+        Return cached variant bytes or `None` on a cache miss.
+        """
+        if not self.enabled:
+            return None
+        path = self._variant_path(filename, height, file_format, profile)
+        try:
+            with open(path, 'rb') as variant:
+                data = variant.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def set(self, filename, height, file_format, data, profile=''):
+        """
+        Store variant bytes, evicting old variants if over budget.
+        """
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._variant_path(filename, height, file_format, profile)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first, so that concurrent readers
+        # never see a partially written variant.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += len(data)
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def delete(self, filename):
+        """
+        Remove all cached variants of the image.
+        """
+        shutil.rmtree(self._image_dir(filename), ignore_errors=True)
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.location):
+            return entries
+        for image_dir in os.scandir(self.location):
+            if not image_dir.is_dir():
+                continue
+            for variant in os.scandir(image_dir.path):
+                if variant.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = variant.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, variant.path))
+        return entries
+
+    def _evict(self):
+        # Other processes write to the same directory, so the running
+        # size is only an estimate and it's recomputed from disk here.
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * self.LOW_WATERMARK
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        self._size = total
+
+
+@lru_cache(maxsize=None)
+def _thumbnail_cache(location, max_bytes):
+    return ThumbnailCache(location, max_bytes)
+
+
+def get_thumbnail_cache():
+    """
+    Return thumbnail cache configured in settings.
+    """
+    return _thumbnail_cache(
+        str(settings.THUMBNAIL_CACHE_DIR),
+        settings.THUMBNAIL_CACHE_MAX_BYTES
+    )
+
+
+def get_variant_basename(height, file_format, profile=''):
+    """
+    Return file name of the variant, `profile` is the key of its encoder
+    options, so variants of changed profiles are never served.
+    """
+    if profile:
+        return f'{height}-{profile}.{file_format.lower()}'
+    return f'{height}.{file_format.lower()}'
+
+
+def get_variant_name(filename, height, file_format, profile=''):
+    return f'variants/{filename}/{get_variant_basename(height, file_format, profile)}'
+
+
+def get_shared_variant(filename, height, file_format, profile=''):
+    """
+    Return variant bytes from storage shared by all nodes, if there is one.
+
+    The local thumbnail cache is the hot tier of a node, while variants
+    kept in `VARIANT_STORAGE` are rendered once for the whole cluster.
+    """
+    if not settings.VARIANT_STORAGE:
+        return None
+    try:
+        with variant_storage.open(
+            get_variant_name(filename, height, file_format, profile), 'rb'
+        ) as variant:
+            return variant.read()
+    except FileNotFoundError:
+        return None
+
+
+def set_shared_variant(filename, height, file_format, data, profile=''):
+    if not settings.VARIANT_STORAGE:
+        return
+    name = get_variant_name(filename, height, file_format, profile)
+    if not variant_storage.exists(name):
+        variant_storage.save(name, ContentFile(data))
+
+
+def delete_shared_variants(filename):
+    if not settings.VARIANT_STORAGE:
+        return
+    directory = f'variants/{filename}'
+    try:
+        _, files = variant_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in files:
+        variant_storage.delete(f'{directory}/{name}')
@@ -9,3 +9,25 @@ EXTENSION_MAPPER = {
     'jpg': 'image/jpg',
     'jpeg': 'image/jpeg',
 }
+
+# Pillow formats and content types they are delivered as, multi-picture
+# JPEGs of cameras are plain JPEGs to clients
+FORMAT_CONTENT_TYPE_MAPPER = {
+    'JPEG': 'image/jpeg',
+    'MPO': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+FORMAT_MAPPER = {
+    'png': 'PNG',
+    'jpg': 'JPEG',
+    'jpeg': 'JPEG',
+}
+
+# Pillow formats of decoded originals and formats their variants keep
+VARIANT_FORMAT_MAPPER = {
+    'JPEG': 'JPEG',
+    'MPO': 'JPEG',
+    'PNG': 'PNG',
+}
@@ -0,0 +1,102 @@
+import os
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date
+from .asgi import AsyncFileResponse
+from .const import EXTENSION_MAPPER, FORMAT_CONTENT_TYPE_MAPPER
+from .metrics import stage
+from .rendering import (
+    get_variant_etag, get_variant_format, get_variant_options
+)
+
+DJANGO = 'django'
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+
+def get_original_response(image_file, response_class=FileResponse):
+    """
+    Return response delivering stored original byte for byte.
+
+    By default the file is streamed with `FileResponse`, which lets
+    the WSGI server use `sendfile()` through `wsgi.file_wrapper`, or
+    with another `response_class`. In
+    the proxy modes authorization is done by Django and the transfer
+    itself is handed over to the front proxy with `X-Accel-Redirect`
+    (nginx) or `X-Sendfile` (Apache, lighttpd) header.
+    """
+    # Format read at upload tells the actual content, the extension is
+    # only used for images awaiting metadata backfill.
+    content_type = FORMAT_CONTENT_TYPE_MAPPER.get(image_file.instance.format)
+    if content_type is None:
+        _, extension = os.path.splitext(image_file.name)
+        content_type = EXTENSION_MAPPER[extension[1:].lower()]
+    mode = settings.IMAGE_SERVE_MODE
+    if mode == X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = (
+            f'{settings.IMAGE_ACCEL_REDIRECT_LOCATION}{image_file.name}'
+        )
+        return response
+    if mode == X_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = image_file.storage.path(image_file.name)
+        return response
+    with stage('open'):
+        file = image_file.storage.open(image_file.name, 'rb')
+    return response_class(file, content_type=content_type)
+
+
+async def aget_original_response(image_file):
+    """
+    Async version of `get_original_response`.
+
+    The file is opened in a thread, with remote storage that's an HTTP
+    request, and its blocks are read in threads by `asgi.ASGIHandler`.
+    """
+    if settings.IMAGE_SERVE_MODE != DJANGO:
+        return get_original_response(image_file)
+    return await sync_to_async(
+        get_original_response, thread_sensitive=False
+    )(image_file, AsyncFileResponse)
+
+
+def get_variant_response(data, file_format):
+    return HttpResponse(
+        data, content_type=FORMAT_CONTENT_TYPE_MAPPER[file_format]
+    )
+
+
+def get_response_format(request, image_record, size):
+    """
+    Return format of the requested variant negotiated from the `Accept`
+    header, or `None` for originals, which are always delivered as they
+    were uploaded.
+    """
+    if not size:
+        return None
+    return get_variant_format(
+        image_record.img, request.headers.get('Accept', '')
+    )
+
+
+def get_validators(image_record, size, file_format=None, options=None):
+    """
+    Return ETag and Last-Modified timestamp of the image variant encoded
+    with `options`, by default those of the owner's account size.
+    """
+    file_format = file_format or get_variant_format(image_record.img)
+    if options is None:
+        options = get_variant_options(image_record.img, size, file_format)
+    etag = get_variant_etag(
+        image_record.img.name, size, file_format, options
+    )
+    last_modified = int(image_record.created_at.timestamp())
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,55 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from ocean.blobs import get_digest
+from ocean.metadata import get_metadata
+from ocean.models import Image
+
+METADATA_FIELDS = ['width', 'height', 'format', 'file_size', 'digest']
+
+
+class Command(BaseCommand):
+    help = 'Store dimensions, format, byte size and digest of images missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of images updated in one query.'
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        start = time.monotonic()
+        missing = Image.objects.filter(
+            Q(width__isnull=True) | Q(digest='')
+        ).only('id', 'img')
+        position = 0
+        images_count = 0
+        failed_count = 0
+        while True:
+            batch = list(
+                missing.filter(pk__gt=position).order_by('pk')[:batch_size]
+            )
+            if not batch:
+                break
+            position = batch[-1].pk
+            updated = []
+            for image in batch:
+                try:
+                    with image.img.storage.open(image.img.name, 'rb') as file:
+                        image.digest = get_digest(file)
+                        for name, value in get_metadata(file).items():
+                            setattr(image, name, value)
+                except Exception as e:
+                    # Missing or broken files are left for inspection.
+                    self.stderr.write(f'Skipped {image.img.name}: {e}')
+                    failed_count += 1
+                    continue
+                updated.append(image)
+            Image.objects.bulk_update(updated, METADATA_FIELDS)
+            images_count += len(updated)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {images_count} images, skipped {failed_count} '
+            f'in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,352 @@
+import json
+import platform
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from io import BytesIO
+from uuid import uuid4
+import django
+from PIL import Image as PImage
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from ocean.cache import delete_shared_variants, get_thumbnail_cache
+from ocean.models import Account, Image, Size, User
+from ocean.sizes import clear_sizes_cache
+
+
+class Rollback(Exception):
+    pass
+
+
+RSS_DEFINITIONS = {
+    'peak_rss_bytes': (
+        'Highest resident set size of the benchmark process during a '
+        'measured request of the scenario. The high-water mark is reset '
+        'before every request, so memory of earlier scenarios and of '
+        'untimed preparation is not included. null where it can\'t be '
+        'reset, which needs Linux.'
+    ),
+    'peak_rss_growth_bytes': (
+        'Largest growth of the resident set size during a measured '
+        'request over the size right before it, the memory the request '
+        'itself needed.'
+    ),
+}
+
+
+def reset_peak_rss():
+    """
+    Reset peak resident set size of the process to the current one.
+
+    Return whether it's supported, it needs `/proc/self/clear_refs`.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def get_rss():
+    """
+    Return current and peak resident set size of the process in bytes.
+    """
+    with open('/proc/self/status') as file:
+        status = dict(re.findall(r'^(VmRSS|VmHWM):\s+(\d+) kB', file.read(), re.M))
+    return int(status['VmRSS']) * 1024, int(status['VmHWM']) * 1024
+
+
+def percentile(values, percent):
+    """
+    Return nearest-rank percentile of sorted `values`.
+    """
+    index = max(int(len(values) * percent / 100 + 0.5) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(latencies, elapsed, peak_rss=None, peak_rss_growth=None):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'throughput_per_s': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'min': round(latencies[0] * 1000, 3),
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p90': round(percentile(latencies, 90) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3),
+        },
+        'peak_rss_bytes': peak_rss,
+        'peak_rss_growth_bytes': peak_rss_growth,
+    }
+
+
+def make_image(width, height, file_format):
+    """
+    Return synthetic photo-like image encoded in `file_format`.
+
+    Gradients with sensor-like noise compress about as well as real
+    photos, unlike flat colors which would make encoding unrealistically
+    cheap.
+    """
+    noise = PImage.effect_noise((width, height), 32)
+    horizontal = PImage.linear_gradient('L').resize((width, height))
+    vertical = horizontal.rotate(90).resize((width, height))
+    img = PImage.merge('RGB', (
+        PImage.blend(horizontal, noise, 0.3),
+        PImage.blend(vertical, noise, 0.3),
+        noise,
+    ))
+    buffer = BytesIO()
+    img.save(buffer, file_format)
+    return buffer.getvalue()
+
+
+def parse_resolution(value):
+    try:
+        width, height = value.lower().split('x')
+        return int(width), int(height)
+    except ValueError:
+        raise CommandError(f'Invalid resolution {value!r}, expected WIDTHxHEIGHT.')
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark upload, listing, original delivery and thumbnail '
+        'rendering and write results as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='-',
+            help='File the JSON results are written to, - for stdout.'
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Number of requests measured in each scenario.'
+        )
+        parser.add_argument(
+            '--resolutions', default='1920x1080,4000x3000',
+            help='Comma separated resolutions of the synthetic images.'
+        )
+        parser.add_argument(
+            '--list-sizes', default='10,1000,100000',
+            help='Comma separated numbers of images per user the listing '
+                 'is measured at.'
+        )
+        parser.add_argument(
+            '--heights', default='200,400',
+            help='Comma separated thumbnail heights.'
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        self.iterations = kwargs['iterations']
+        self.resolutions = [
+            parse_resolution(value) for value in kwargs['resolutions'].split(',')
+        ]
+        self.list_sizes = [int(value) for value in kwargs['list_sizes'].split(',')]
+        self.heights = [int(value) for value in kwargs['heights'].split(',')]
+        media_root = tempfile.mkdtemp()
+        cache_dir = tempfile.mkdtemp()
+        # Everything runs in a transaction rolled back at the end, so the
+        # benchmark leaves no rows behind and can't see commit hooks such
+        # as pregeneration firing in the middle of a measurement.
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root,
+                THUMBNAIL_CACHE_DIR=cache_dir,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']
+            ), transaction.atomic():
+                results = self.run_scenarios()
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            clear_sizes_cache()
+            shutil.rmtree(media_root, ignore_errors=True)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        report = {
+            'revision': get_revision(),
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'iterations': self.iterations,
+            'definitions': RSS_DEFINITIONS,
+            'results': results,
+        }
+        data = json.dumps(report, indent=2)
+        if kwargs['output'] == '-':
+            self.stdout.write(data)
+            return
+        with open(kwargs['output'], 'w') as file:
+            file.write(data + '\n')
+        for name, result in results.items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:<36} p50 {latency['p50']:>9.2f}ms  "
+                f"p99 {latency['p99']:>9.2f}ms  "
+                f"{result['throughput_per_s']:>9.1f}/s"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results written to {kwargs['output']}"))
+
+    def create_client(self, account):
+        user = User.objects.create(
+            account_type=account, username=f'benchmark-{uuid4().hex[:12]}'
+        )
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}'
+        )
+        return user, client
+
+    def measure(self, request, prepare=None):
+        """
+        Time `iterations` calls of `request`, running `prepare` untimed
+        before each of them, and track their peak memory.
+        """
+        latencies = []
+        elapsed = 0
+        peak_rss = peak_rss_growth = None
+        for index in range(self.iterations):
+            if prepare is not None:
+                prepare(index)
+            tracked = reset_peak_rss()
+            if tracked:
+                rss, _ = get_rss()
+            start = time.perf_counter()
+            request(index)
+            latency = time.perf_counter() - start
+            latencies.append(latency)
+            elapsed += latency
+            if tracked:
+                _, peak = get_rss()
+                peak_rss = max(peak_rss or 0, peak)
+                peak_rss_growth = max(peak_rss_growth or 0, peak - rss)
+        return summarize(latencies, elapsed, peak_rss, peak_rss_growth)
+
+    def run_scenarios(self):
+        # Render limits would measure admission waits instead of renders.
+        account = Account.objects.create(
+            name=f'benchmark-{uuid4().hex[:8]}', description='Benchmark',
+            render_concurrency=0, render_rate=0
+        )
+        Size.objects.bulk_create([
+            Size(account_type=account, height=height)
+            for height in [0, *self.heights]
+        ])
+        # Bulk inserts don't send the signals invalidating the cache.
+        clear_sizes_cache()
+        results = {}
+        _, client = self.create_client(account)
+        uploaded = []
+        for file_format, extension in [('JPEG', 'jpg'), ('PNG', 'png')]:
+            for width, height in self.resolutions:
+                name = f'{extension}_{width}x{height}'
+                data = None
+                names = []
+
+                def generate(index):
+                    # Identical uploads would be deduplicated, so every
+                    # upload gets its own noise.
+                    nonlocal data
+                    data = make_image(width, height, file_format)
+
+                def upload(index):
+                    file = BytesIO(data)
+                    file.name = f'image.{extension}'
+                    response = client.post(
+                        '/api/images/', {'img': file}, format='multipart'
+                    )
+                    check(response, 201)
+                    names.append(response.data['original'].rsplit('/', 1)[-1])
+
+                results[f'upload_{name}'] = self.measure(
+                    upload, prepare=generate
+                )
+                uploaded.append((name, names))
+        for name, names in uploaded:
+            def original(index):
+                response = client.get(f'/api/images/{names[index]}')
+                check(response, 200)
+                # Consuming the content also closes the file.
+                b''.join(response.streaming_content)
+
+            results[f'original_{name}'] = self.measure(original)
+            for height in self.heights:
+                def thumbnail(index):
+                    response = client.get(
+                        f'/api/images/{names[index]}', {'size': height}
+                    )
+                    check(response, 200)
+
+                def clear(index):
+                    # Variants are cached under the name of the file.
+                    filename = Image.objects.values_list(
+                        'img', flat=True
+                    ).get(name=names[index])
+                    get_thumbnail_cache().delete(filename)
+                    delete_shared_variants(filename)
+
+                results[f'thumbnail_cold_{name}_{height}px'] = self.measure(
+                    thumbnail, prepare=clear
+                )
+                results[f'thumbnail_warm_{name}_{height}px'] = self.measure(
+                    thumbnail
+                )
+        for count in self.list_sizes:
+            results[f'list_{count}'] = self.measure_listing(account, count)
+        return results
+
+    def measure_listing(self, account, count):
+        """
+        Walk pages of a user owning `count` images, starting over once
+        the last page is reached.
+        """
+        user, client = self.create_client(account)
+        for start in range(0, count, 10000):
+            Image.objects.bulk_create([
+                Image(
+                    owner=user,
+                    name=f'{user.pk}-{index}.jpg',
+                    img=f'{user.pk}-{index}.jpg'
+                )
+                for index in range(start, min(start + 10000, count))
+            ])
+        next_link = None
+
+        def page(index):
+            nonlocal next_link
+            response = client.get(next_link or '/api/images/')
+            check(response, 200)
+            next_link = response.data['next']
+
+        return self.measure(page)
+
+
+def check(response, status_code):
+    if response.status_code != status_code:
+        raise CommandError(
+            f'Unexpected response {response.status_code}: {response.content[:200]!r}'
+        )
@@ -0,0 +1,73 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ocean.models import Blob, Image
+
+
+class Command(BaseCommand):
+    help = 'Delete expired images with their files and cached variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of images deleted in one transaction.'
+        )
+        parser.add_argument(
+            '--time-budget', type=float, default=0,
+            help='Stop after this many seconds, 0 means no limit.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report images that would be deleted.'
+        )
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        time_budget = kwargs['time_budget']
+        dry_run = kwargs['dry_run']
+        now = timezone.now()
+        start = time.monotonic()
+        expired = Image.objects.filter(exp_after__lt=now)
+        position = None
+        images_count = 0
+        files_count = 0
+        while not time_budget or time.monotonic() - start < time_budget:
+            batch = expired
+            if position is not None:
+                exp_after, pk = position
+                batch = batch.filter(
+                    Q(exp_after__gt=exp_after) | Q(exp_after=exp_after, pk__gt=pk)
+                )
+            batch = list(batch.order_by('exp_after', 'pk')[:batch_size])
+            if not batch:
+                break
+            position = (batch[-1].exp_after, batch[-1].pk)
+            images_count += len(batch)
+            if dry_run:
+                continue
+            blob_ids = {image.blob_id for image in batch if image.blob_id}
+            with transaction.atomic():
+                # Deleting through the queryset sends `post_delete`,
+                # which drops cached variants of every image and
+                # releases their blobs.
+                Image.objects.filter(pk__in=[image.pk for image in batch]).delete()
+            # Blobs are gone with their files once no image uses them.
+            files_count += len(blob_ids) - Blob.objects.filter(
+                pk__in=blob_ids
+            ).count()
+            for image in batch:
+                if image.blob_id is None \
+                        and image.img.storage.exists(image.img.name):
+                    image.img.storage.delete(image.img.name)
+                    files_count += 1
+        elapsed = time.monotonic() - start
+        rate = images_count / elapsed if elapsed else 0
+        if dry_run:
+            self.stdout.write(f'Would delete {images_count} expired images')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {images_count} expired images and {files_count} '
+                f'files in {elapsed:.2f}s ({rate:.1f} images/s)'
+            ))
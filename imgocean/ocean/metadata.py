@@ -0,0 +1,24 @@
+import os
+from PIL import Image as PImage
+
+
+def get_metadata(file):
+    """
+    Return dict of `Image` metadata fields describing the image file.
+
+    Only the header is parsed, pixels aren't decoded. The content digest
+    is computed together with the blob's, see `blobs.get_digest`.
+    """
+    file.seek(0)
+    with PImage.open(file) as img:
+        width, height = img.size
+        file_format = img.format
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell()
+    file.seek(0)
+    return {
+        'width': width,
+        'height': height,
+        'format': file_format,
+        'file_size': file_size,
+    }
@@ -0,0 +1,198 @@
+"""
+Request instrumentation.
+
+Stages of the image pipeline are timed with `stage()`. Timings of the
+current request are collected by `RequestMetricsMiddleware`, returned in
+the `Server-Timing` header and aggregated into histograms, which are
+exposed in Prometheus text format. Histograms live in process memory,
+so every worker process reports its own.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """
+    Thread-safe histogram with Prometheus text exposition.
+    """
+    def __init__(self, name, description, labels, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {
+                    'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0
+                }
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def collect(self):
+        """
+        Return lines of the histogram in Prometheus text format.
+        """
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = [
+                (label_values, dict(values, counts=list(values['counts'])))
+                for label_values, values in sorted(self._series.items())
+            ]
+        for label_values, values in series:
+            labels = ','.join(
+                f'{label}="{_escape(value)}"'
+                for label, value in zip(self.labels, label_values)
+            )
+            separator = ',' if labels else ''
+            cumulative = 0
+            for bucket, count in zip(self.buckets, values['counts']):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels}{separator}le="{bucket}"}} {cumulative}'
+                )
+            lines.append(
+                f'{self.name}_bucket{{{labels}{separator}le="+Inf"}} {values["count"]}'
+            )
+            lines.append(f'{self.name}_sum{{{labels}}} {values["sum"]}')
+            lines.append(f'{self.name}_count{{{labels}}} {values["count"]}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'ocean_request_duration_seconds',
+    'Time spent handling requests.',
+    ('route', 'method', 'status', 'size')
+)
+STAGE_DURATION = Histogram(
+    'ocean_stage_duration_seconds',
+    'Time spent in stages of handling requests.',
+    ('route', 'stage', 'size')
+)
+REQUEST_QUERIES = Histogram(
+    'ocean_request_queries',
+    'Database queries made by requests.',
+    ('route', 'method'),
+    QUERIES_BUCKETS
+)
+HISTOGRAMS = [REQUEST_DURATION, STAGE_DURATION, REQUEST_QUERIES]
+
+
+class RequestTimings:
+    """
+    Durations of stages and queries of a single request.
+    """
+    def __init__(self):
+        self.stages = {}
+        self.queries = 0
+
+    def add(self, name, duration):
+        self.stages[name] = self.stages.get(name, 0) + duration
+
+
+_current_timings = contextvars.ContextVar('ocean_request_timings', default=None)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    Add the query to timings of the current request.
+
+    It's installed on every connection, as requests may run queries on
+    connections of other threads, which inherit the request's context.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', time.perf_counter() - start)
+
+
+def start_request():
+    """
+    Start collecting timings of the current request.
+    """
+    timings = RequestTimings()
+    return timings, _current_timings.set(timings)
+
+
+def end_request(token):
+    _current_timings.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    Add time spent in the block to stage `name` of the current request.
+
+    Outside of an instrumented request it does nothing.
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def get_server_timing(timings, total):
+    """
+    Return `Server-Timing` header value of the request's timings.
+    """
+    metrics = []
+    for name, duration in timings.stages.items():
+        metric = f'{name};dur={duration * 1000:.2f}'
+        if name == 'db':
+            metric += f';desc="{timings.queries} queries"'
+        metrics.append(metric)
+    metrics.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(metrics)
+
+
+def observe_request(route, method, status, size, timings, total):
+    REQUEST_DURATION.observe(total, route, method, status, size)
+    REQUEST_QUERIES.observe(timings.queries, route, method)
+    for name, duration in timings.stages.items():
+        STAGE_DURATION.observe(duration, route, name, size)
+
+
+def export_metrics():
+    """
+    Return all histograms in Prometheus text format.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.collect())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from django.conf import settings
+from .metrics import end_request, get_server_timing, observe_request, start_request
+
+
+def get_size_tier(request, response):
+    """
+    Return size label of an image request.
+
+    Only sizes of successful responses are used, which were checked
+    against the account's sizes, so clients can't create new series.
+    """
+    match = request.resolver_match
+    if match is None or 'filename' not in match.kwargs:
+        return ''
+    if response.status_code >= 400:
+        return 'invalid'
+    size = request.GET.get('size', '0')
+    return str(int(size)) if size.isdigit() else 'invalid'
+
+
+class RequestMetricsMiddleware:
+    """
+    Time requests with their database queries and pipeline stages.
+
+    Timings are added to the `Server-Timing` header when `SERVER_TIMING`
+    is enabled and aggregated into histograms when `METRICS_ENABLED` is.
+    Streamed response bodies are sent after the timings are taken.
+
+    Queries are counted by a wrapper installed on every connection, so
+    queries of async views, which run in `sync_to_async` threads with
+    their own connections, are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Let the handler await the middleware instead of adapting
+            # it, as Django's `MiddlewareMixin` does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def is_enabled(self):
+        return settings.SERVER_TIMING or settings.METRICS_ENABLED
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.is_enabled():
+            return self.get_response(request)
+        timings, token = start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.process_timings(request, response, timings, start)
+
+    async def __acall__(self, request):
+        if not self.is_enabled():
+            return await self.get_response(request)
+        timings, token = start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.process_timings(request, response, timings, start)
+
+    def process_timings(self, request, response, timings, start):
+        total = time.perf_counter() - start
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = get_server_timing(timings, total)
+        if settings.METRICS_ENABLED:
+            match = request.resolver_match
+            observe_request(
+                match.route if match else '',
+                request.method,
+                str(response.status_code),
+                get_size_tier(request, response),
+                timings,
+                total
+            )
+        return response
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:38
+
+import django.core.validators
+from django.db import migrations, models
+import ocean.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocean', '0004_alter_image_exp_after'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='img',
+            field=models.ImageField(max_length=50, unique=True, upload_to=ocean.models.upload_to, validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'], 'Allowed formats are [JPG, JPEG, PNG].')]),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['owner', 'created_at', 'id'], name='image_owner_created_at_idx'),
+        ),
+    ]
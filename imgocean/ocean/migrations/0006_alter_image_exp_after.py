@@ -0,0 +1,19 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:38
+
+from django.db import migrations, models
+import ocean.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocean', '0005_alter_image_img_image_image_owner_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='exp_after',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, validators=[ocean.models.validate_exp_after]),
+        ),
+    ]
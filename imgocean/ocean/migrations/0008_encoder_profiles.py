@@ -0,0 +1,64 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:52
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocean', '0007_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='compress_level',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='PNG zlib compression level.', null=True, validators=[django.core.validators.MaxValueValidator(9)]),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='optimize',
+            field=models.BooleanField(blank=True, help_text='Spend extra encoding time on smaller JPEG and PNG.', null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='progressive',
+            field=models.BooleanField(blank=True, help_text='Write progressive JPEG.', null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='quality',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='JPEG and WebP quality.', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='strip_metadata',
+            field=models.BooleanField(blank=True, help_text='Drop EXIF and ICC profile of the original.', null=True),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='compress_level',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='PNG zlib compression level.', null=True, validators=[django.core.validators.MaxValueValidator(9)]),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='optimize',
+            field=models.BooleanField(blank=True, help_text='Spend extra encoding time on smaller JPEG and PNG.', null=True),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='progressive',
+            field=models.BooleanField(blank=True, help_text='Write progressive JPEG.', null=True),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='quality',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='JPEG and WebP quality.', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddField(
+            model_name='size',
+            name='strip_metadata',
+            field=models.BooleanField(blank=True, help_text='Drop EXIF and ICC profile of the original.', null=True),
+        ),
+    ]
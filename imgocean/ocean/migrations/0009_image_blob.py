@@ -0,0 +1,53 @@
+# Generated by Django 4.0.4 on 2026-10-18 10:57
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import ocean.models
+
+
+def set_names(apps, schema_editor):
+    # Existing images keep their file names as public names.
+    Image = apps.get_model('ocean', 'Image')
+    Image.objects.update(name=models.F('img'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocean', '0008_encoder_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=100)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='name',
+            field=models.CharField(max_length=50, null=True, unique=True),
+        ),
+        migrations.RunPython(set_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='image',
+            name='name',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='img',
+            field=models.ImageField(upload_to=ocean.models.upload_to, validators=[django.core.validators.FileExtensionValidator(['jpg', 'jpeg', 'png'], 'Allowed formats are [JPG, JPEG, PNG].')]),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='ocean.blob'),
+        ),
+    ]
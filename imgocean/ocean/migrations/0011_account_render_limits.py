@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-18 11:06
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ocean', '0010_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='render_burst',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Renders allowed at once above the rate.', null=True, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='render_concurrency',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Renders running at once per owner and process, 0 is unlimited.', null=True),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='render_rate',
+            field=models.FloatField(blank=True, help_text='Renders per second per owner and process, 0 is unlimited.', null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
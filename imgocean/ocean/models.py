@@ -5,7 +5,7 @@ from django.db import models
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.core.validators import (
-    FileExtensionValidator
+    FileExtensionValidator, MaxValueValidator, MinValueValidator
 )
 from django.contrib.auth.models import AbstractUser
 
@@ -17,17 +17,78 @@ def validate_exp_after(value):
         raise ValidationError("Expiration seconds should be between 300 and 30000.")
     return value
 
+ENCODER_PROFILE_FIELDS = [
+    'quality', 'progressive', 'optimize', 'compress_level', 'strip_metadata'
+]
+
+RENDER_LIMIT_FIELDS = ['render_concurrency', 'render_rate', 'render_burst']
+
 def upload_to(instance, filename):
     _, extension = os.path.splitext(filename)
     return f'{uuid4()}{extension}'
 
-class Account(models.Model):
+class EncoderProfile(models.Model):
+    """
+    Encoder options of thumbnails. Options left unset on a size fall
+    back to its account's and then to Pillow defaults.
+    """
+    quality = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        help_text='JPEG and WebP quality.'
+    )
+    progressive = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text='Write progressive JPEG.'
+    )
+    optimize = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text='Spend extra encoding time on smaller JPEG and PNG.'
+    )
+    compress_level = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MaxValueValidator(9)],
+        help_text='PNG zlib compression level.'
+    )
+    strip_metadata = models.BooleanField(
+        null=True,
+        blank=True,
+        help_text='Drop EXIF and ICC profile of the original.'
+    )
+
+    class Meta:
+        abstract = True
+
+class Account(EncoderProfile):
     name = models.CharField(max_length=20, unique=True)
     description = models.TextField()
     can_generate_exp_links = models.BooleanField(
         null=False,
         default=False
     )
+    # Admission of thumbnail renders of each owner's images, unset
+    # limits fall back to `RENDER_ADMISSION_*` settings.
+    render_concurrency = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        help_text='Renders running at once per owner and process, 0 is unlimited.'
+    )
+    render_rate = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        help_text='Renders per second per owner and process, 0 is unlimited.'
+    )
+    render_burst = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1)],
+        help_text='Renders allowed at once above the rate.'
+    )
 
     def __str__(self) -> str:
         return self.name
@@ -39,10 +100,37 @@ class User(AbstractUser):
         return self.username
 
 
+class Blob(models.Model):
+    """
+    Original file shared by all images of the same content.
+
+    `references` counts images pointing at the blob, its file is deleted
+    together with the last of them.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    def __str__(self) -> str:
+        return self.digest
+
+
 class Image(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Public name of the image, its file is named after the content.
+    name = models.CharField(max_length=50, unique=True)
+    # Images uploaded before deduplication have no blob and own their file.
+    blob = models.ForeignKey(
+        Blob,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT
+    )
     img = models.ImageField(
-        max_length=50,
+        max_length=100,
         upload_to=upload_to,
         validators=[
             FileExtensionValidator(
@@ -51,6 +139,13 @@ class Image(models.Model):
             )
         ]
     )
+    # Metadata of the file read once at upload, unset on images uploaded
+    # before they were stored until `backfill_image_metadata` is run.
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    format = models.CharField(max_length=10, blank=True)
+    file_size = models.PositiveBigIntegerField(null=True, blank=True)
+    digest = models.CharField(max_length=64, blank=True)
 
     created_at = models.DateTimeField(
         auto_now_add=True
@@ -58,15 +153,34 @@ class Image(models.Model):
 
     exp_after = models.DateTimeField(
         null=True,
+        blank=True,
+        db_index=True,
         validators=[
             validate_exp_after
         ]
     )
 
+    class Meta:
+        indexes = [
+            # Covers keyset pagination of the owner's images.
+            models.Index(
+                fields=['owner', 'created_at', 'id'],
+                name='image_owner_created_at_idx'
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.name:
+            # Image without a blob is named after its own file.
+            if self.img and not self.img._committed:
+                self.img.save(self.img.name, self.img.file, save=False)
+            self.name = self.img.name
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
-        return self.img.name
+        return self.name
 
-class Size(models.Model):
+class Size(EncoderProfile):
     account_type = models.ForeignKey(Account, on_delete=models.CASCADE)
     height = models.PositiveIntegerField()
 
@@ -76,4 +190,18 @@ class Size(models.Model):
         ]
 
     def __str__(self) -> str:
-        return f"{self.height}"
\ No newline at end of file
+        return f"{self.height}"
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=50)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    exp_after = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    def __str__(self) -> str:
+        return f"{self.filename} ({self.offset}/{self.size})"
@@ -0,0 +1,87 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ImageKeysetPagination(BasePagination):
+    """
+    Keyset pagination of images ordered by `created_at` and `id`.
+
+    The cursor holds position of the last image of the previous page,
+    so every page is a single index range scan no matter how deep it
+    is, unlike `OFFSET` which reads and skips all preceding rows.
+    Rows of the page are streamed from the database cursor instead of
+    being loaded into a list at once.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, created_at, pk):
+        position = f'{created_at.isoformat()}|{pk}'
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_at, pk = urlsafe_b64decode(encoded.encode()).decode().split('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at)
+                | Q(created_at=created_at, pk__gt=pk)
+            )
+        queryset = queryset.order_by('created_at', 'pk')
+        # One extra row tells if there is a next page.
+        rows = queryset[:self.page_size + 1].iterator()
+        return self.__stream_page(rows)
+
+    def __stream_page(self, rows):
+        last = None
+        for index, row in enumerate(rows):
+            if index == self.page_size:
+                self.next_position = (last.created_at, last.pk)
+                break
+            last = row
+            yield row
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(*self.next_position)
+        )
+        return url
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,78 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from .rendering import get_or_render_variant, get_variant_formats
+from .sizes import get_account_heights
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_pregenerate_executor():
+    """
+    Return process-wide pool of thumbnail pre-generation workers.
+
+    Pillow releases the GIL while decoding, resizing and encoding, so
+    threads render in parallel without the pickling and startup costs
+    of a process pool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_PREGENERATE_WORKERS,
+                thread_name_prefix='pregenerate'
+            )
+        return _executor
+
+
+def render_variants(image_file, heights):
+    """
+    Render and cache all `heights` variants of the image file in every
+    format they can be negotiated to.
+
+    Run by pool threads, which outlive requests, so the job closes
+    database connections that are broken or over `CONN_MAX_AGE` itself,
+    as request signals do for request threads.
+    """
+    close_old_connections()
+    try:
+        for height in heights:
+            for file_format in get_variant_formats(image_file):
+                try:
+                    get_or_render_variant(image_file, height, file_format)
+                except Exception:
+                    logger.exception(
+                        'Failed to pre-generate %s %s variant of %s',
+                        height, file_format, image_file.name
+                    )
+    finally:
+        close_old_connections()
+
+
+def pregenerate_variants(image):
+    """
+    Queue rendering of every thumbnail size of the owner's account.
+
+    Jobs are submitted once the upload transaction is committed, so
+    workers never see files of rolled back uploads. Variants that
+    aren't rendered yet are still rendered on demand by the detail view.
+    """
+    if not settings.THUMBNAIL_PREGENERATE_WORKERS:
+        return
+    heights = sorted(
+        height
+        for height in get_account_heights(image.owner.account_type_id)
+        if height
+    )
+    if not heights:
+        return
+    transaction.on_commit(
+        lambda: get_pregenerate_executor().submit(
+            render_variants, image.img, heights
+        )
+    )
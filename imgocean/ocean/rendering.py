@@ -0,0 +1,475 @@
+import asyncio
+import contextvars
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, ExitStack, contextmanager
+from functools import lru_cache
+from io import BytesIO
+from PIL import Image as PImage, features
+from django.conf import settings
+from django.db import close_old_connections
+from .cache import (
+    get_shared_variant, get_thumbnail_cache, set_shared_variant
+)
+from .const import FORMAT_MAPPER, VARIANT_FORMAT_MAPPER
+from .metrics import stage
+from .singleflight import SingleFlight, file_lock
+from .sizes import get_encoder_profile
+
+
+WEBP = 'WEBP'
+
+
+@lru_cache(maxsize=None)
+def webp_supported():
+    return features.check('webp')
+
+
+def accepts_webp(accept):
+    """
+    Return whether the `Accept` header lists WebP explicitly.
+
+    Wildcards aren't enough, browsers without WebP support send them too.
+    """
+    for media_range in accept.split(','):
+        media_type, *params = [part.strip() for part in media_range.split(';')]
+        if media_type.lower() != 'image/webp':
+            continue
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def get_variant_format(image_file, accept=''):
+    """
+    Return Pillow format name the image variants are encoded in.
+
+    Variants are encoded in WebP if it's enabled and the client accepts
+    it, otherwise they keep the format of the original's content, which
+    may not match its extension. The extension is only used for images
+    awaiting metadata backfill.
+    """
+    if settings.THUMBNAIL_WEBP and accepts_webp(accept) and webp_supported():
+        return WEBP
+    file_format = VARIANT_FORMAT_MAPPER.get(image_file.instance.format)
+    if file_format is None:
+        _, extension = os.path.splitext(image_file.name)
+        file_format = FORMAT_MAPPER[extension[1:].lower()]
+    return file_format
+
+
+def get_variant_formats(image_file):
+    """
+    Return all formats variants of the image can be negotiated to.
+    """
+    formats = [get_variant_format(image_file)]
+    if settings.THUMBNAIL_WEBP and webp_supported():
+        formats.append(WEBP)
+    return formats
+
+
+# Encoder profile options understood by Pillow encoders of each format
+PROFILE_OPTIONS = {
+    'JPEG': ('quality', 'progressive', 'optimize'),
+    'PNG': ('optimize', 'compress_level'),
+    WEBP: ('quality',),
+}
+
+
+def get_encoder_options(file_format, profile=None):
+    """
+    Return encoder options of the variant format.
+
+    Options of the size's encoder profile which the format supports
+    override the defaults. `strip_metadata` isn't a Pillow option, it's
+    handled by `render_variant`.
+    """
+    options = {}
+    if file_format == WEBP:
+        options = {
+            'quality': settings.THUMBNAIL_WEBP_QUALITY,
+            'method': settings.THUMBNAIL_WEBP_METHOD,
+        }
+    profile = profile or {}
+    for name in PROFILE_OPTIONS.get(file_format, ()):
+        if name in profile:
+            options[name] = profile[name]
+    if 'strip_metadata' in profile:
+        options['strip_metadata'] = profile['strip_metadata']
+    return options
+
+
+def get_variant_options(image_file, size, file_format):
+    """
+    Return encoder options of the image's variant, using the profile of
+    the owner's account size.
+    """
+    account_id = image_file.instance.owner.account_type_id
+    return get_encoder_options(
+        file_format, get_encoder_profile(account_id, size)
+    )
+
+
+def get_profile_key(options):
+    """
+    Return short key of encoder options told apart in cache names, or
+    an empty string for encoder defaults.
+    """
+    if not options:
+        return ''
+    identity = ','.join(
+        f'{name}={value}' for name, value in sorted(options.items())
+    )
+    return hashlib.sha256(identity.encode()).hexdigest()[:8]
+
+
+def get_variant_etag(filename, size, file_format, options=None):
+    """
+    Return strong ETag of the image variant.
+
+    Stored images are never modified, so variant bytes depend only on
+    the image, requested size, output format and rendering settings.
+    """
+    if options is None:
+        options = get_encoder_options(file_format)
+    identity = ':'.join([
+        filename,
+        str(size),
+        file_format,
+        settings.THUMBNAIL_RESAMPLE,
+        str(settings.THUMBNAIL_REDUCING_GAP),
+        *(f'{name}={value}' for name, value in sorted(options.items())),
+    ])
+    return f'"{hashlib.sha256(identity.encode()).hexdigest()[:32]}"'
+
+
+def get_resample_filter():
+    """
+    Return Pillow resampling filter configured in settings.
+    """
+    return getattr(PImage.Resampling, settings.THUMBNAIL_RESAMPLE.upper())
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def check_pixels(width, height):
+    """
+    Raise `ImageTooLarge` if the image has more than `IMAGE_MAX_PIXELS`.
+    """
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ImageTooLarge(
+            f'Image is too large, up to {settings.IMAGE_MAX_PIXELS} pixels are allowed.'
+        )
+
+
+class MemoryBudget:
+    """
+    Bytes of pixel buffers shared by renders of the process.
+
+    Renders wait until their estimated memory fits into what is left of
+    the budget, a render bigger than the whole budget runs alone.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        if not self.max_bytes:
+            yield
+            return
+        nbytes = min(nbytes, self.max_bytes)
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.used + nbytes <= self.max_bytes
+            )
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.used -= nbytes
+                self._condition.notify_all()
+
+
+@lru_cache(maxsize=None)
+def _render_budget(max_bytes):
+    return MemoryBudget(max_bytes)
+
+
+def get_render_budget():
+    """
+    Return memory budget of renders configured in settings.
+    """
+    return _render_budget(settings.RENDER_MEMORY_BUDGET)
+
+
+def get_pixel_bytes(mode):
+    # Pillow keeps pixels of multi-band and 32-bit modes in 4 bytes.
+    return 1 if mode in ('1', 'L', 'P') else 4
+
+
+def estimate_render_memory(mode, decoded_size, target_size=None):
+    """
+    Return peak bytes of pixel buffers of rendering image of `mode`,
+    decoded at `decoded_size`, resized to `target_size` (`None` keeps
+    the decoded size).
+
+    The peak is reached in `resize()`, which holds the decoded image,
+    its `reduce()`d copy, the result of the horizontal resampling pass
+    (target width by source height) and the final result at once.
+    Without resizing, the decoded image is held with its encoded bytes,
+    which are at most as big.
+    """
+    pixel_bytes = get_pixel_bytes(mode)
+    width, height = decoded_size
+    decoded = width * height * pixel_bytes
+    if target_size is None:
+        return 2 * decoded
+    target_width, target_height = target_size
+    gap = settings.THUMBNAIL_REDUCING_GAP
+    # Same factors `resize()` reduces the image by.
+    factor_x = int(width / target_width / gap) or 1
+    factor_y = int(height / target_height / gap) or 1
+    reduced = 0
+    if factor_x > 1 or factor_y > 1:
+        width, height = -(-width // factor_x), -(-height // factor_y)
+        reduced = width * height * pixel_bytes
+    horizontal_pass = target_width * height * pixel_bytes
+    resized = target_width * target_height * pixel_bytes
+    return decoded + reduced + horizontal_pass + resized
+
+
+def render_variant(file, size, file_format, options=None):
+    """
+    Render image scaled to `size` pixels of height (0 keeps the original
+    size) and return it encoded in `file_format` with encoder `options`.
+
+    JPEG files are decoded in draft mode, letting libjpeg scale the DCT
+    coefficients by 1/2, 1/4 or 1/8 instead of decoding every pixel.
+    The rest of the way is done by `reduce()`, which cheaply shrinks
+    the image by an integer factor, and a final resample with the
+    configured filter. `THUMBNAIL_REDUCING_GAP` keeps both shortcuts at
+    least that many times bigger than the target, so they don't affect
+    the quality of the final resample.
+
+    Images over `IMAGE_MAX_PIXELS` are rejected from their header. The
+    decoded image is released right after resizing, and renders wait
+    until their `estimate_render_memory` fits into the process budget.
+    """
+    if options is None:
+        options = get_encoder_options(file_format)
+    options = dict(options)
+    strip_metadata = options.pop('strip_metadata', None)
+    with PImage.open(file) as img:
+        check_pixels(*img.size)
+        target_size = None
+        if size:
+            width, height = img.size
+            target_size = (int(width / height * size), size)
+            reducing_gap = settings.THUMBNAIL_REDUCING_GAP
+            img.draft(
+                None,
+                (int(target_size[0] * reducing_gap), int(size * reducing_gap))
+            )
+        with stage('queue'):
+            reservation = ExitStack()
+            reservation.enter_context(get_render_budget().reserve(
+                estimate_render_memory(img.mode, img.size, target_size)
+            ))
+        with reservation:
+            with stage('decode'):
+                img.load()
+            metadata = {
+                key: img.info[key]
+                for key in ('exif', 'icc_profile') if key in img.info
+            }
+            response_img = img
+            if size:
+                with stage('resize'):
+                    response_img = img.resize(
+                        target_size,
+                        resample=get_resample_filter(),
+                        reducing_gap=reducing_gap
+                    )
+                # Only the resized image is needed for encoding.
+                img.close()
+            with stage('encode'):
+                if strip_metadata:
+                    # Some encoders copy metadata left in `info` on their own.
+                    response_img.info = {}
+                elif strip_metadata is not None:
+                    for key, value in metadata.items():
+                        options.setdefault(key, value)
+                buffer = BytesIO()
+                response_img.save(buffer, file_format, **options)
+            return buffer.getvalue()
+
+
+_renders = SingleFlight()
+
+
+def get_render_lock_path(key):
+    """
+    Return lock file of the variant `key` shared by worker processes.
+
+    Keys are hashed into `RENDER_LOCK_STRIPES` files, which bounds the
+    number of lock files at the cost of rare waits on unrelated renders.
+    """
+    digest = hashlib.sha256(repr(key).encode()).digest()
+    stripe = int.from_bytes(digest[:4], 'big') % settings.RENDER_LOCK_STRIPES
+    return os.path.join(settings.RENDER_LOCK_DIR, f'{stripe}.lock')
+
+
+def _render_locked(image_file, size, file_format, options, profile):
+    cache = get_thumbnail_cache()
+    key = (image_file.name, size, file_format, profile)
+    with stage('lock'):
+        # Only the wait for the lock is timed, not the render under it.
+        lock = ExitStack()
+        lock.enter_context(file_lock(get_render_lock_path(key)))
+    with lock:
+        # Another worker could have rendered it while this one waited.
+        with stage('cache'):
+            data = cache.get(image_file.name, size, file_format, profile)
+        if data is not None:
+            return data
+        with stage('cache'):
+            data = get_shared_variant(
+                image_file.name, size, file_format, profile
+            )
+        if data is None:
+            with stage('open'):
+                file = image_file.storage.open(image_file.name, 'rb')
+            with file:
+                data = render_variant(file, size, file_format, options)
+            with stage('cache'):
+                set_shared_variant(
+                    image_file.name, size, file_format, data, profile=profile
+                )
+        with stage('cache'):
+            cache.set(image_file.name, size, file_format, data, profile=profile)
+        return data
+
+
+def get_or_render_variant(image_file, size, file_format=None, admission=None,
+                          options=None):
+    """
+    Return encoded variant of the image file and its format, rendering
+    it only if it isn't cached yet.
+
+    Each format and encoder profile is cached separately, the original's
+    format is used if none is given. Concurrent misses of one variant
+    are coalesced, threads of the process wait for the render already
+    in progress, and other processes of the host wait on its lock file
+    and then find the variant in the cache.
+
+    `admission` is context manager entered before rendering a cache miss,
+    see `admission.admit_render`. It's entered before joining a render
+    in progress, so each request is admitted within its own owner's
+    limits. Encoder `options` default to those of the owner's account
+    size.
+    """
+    file_format = file_format or get_variant_format(image_file)
+    if options is None:
+        options = get_variant_options(image_file, size, file_format)
+    profile = get_profile_key(options)
+    with stage('cache'):
+        data = get_thumbnail_cache().get(
+            image_file.name, size, file_format, profile
+        )
+    if data is not None:
+        return data, file_format
+    image = image_file.instance
+    if image.width and image.height:
+        # Dimensions stored at upload reject the image before its file
+        # is opened.
+        check_pixels(image.width, image.height)
+    with stage('admission'):
+        admitted = ExitStack()
+        if admission is not None:
+            admitted.enter_context(admission)
+    with admitted:
+        data = _renders.do(
+            (image_file.name, size, file_format, profile),
+            _render_locked, image_file, size, file_format, options, profile
+        )
+    return data, file_format
+
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    """
+    Return process-wide pool rendering variants for async views.
+
+    Its size bounds how many renders run at once, no matter how many
+    requests the event loop is holding.
+    """
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(
+                max_workers=settings.RENDER_WORKERS,
+                thread_name_prefix='render'
+            )
+        return _render_executor
+
+
+def _render_in_pool(*args):
+    # Pool threads outlive requests, so connections broken or over
+    # `CONN_MAX_AGE` are closed around each job, as request signals do.
+    close_old_connections()
+    try:
+        return get_or_render_variant(*args)
+    finally:
+        close_old_connections()
+
+
+async def aget_or_render_variant(image_file, size, file_format, options,
+                                 admission=None):
+    """
+    Async version of `get_or_render_variant`.
+
+    The format and encoder `options` must be given, working them out
+    may reload the sizes cache, which can't be queried on the event
+    loop. Cache hits are read on the loop's default executor, so they
+    don't queue behind renders running on the bounded render pool.
+
+    `admission` is async context manager, see `admission.aadmit_render`.
+    Renders wait for it on the loop, before they're handed to the pool,
+    so waiting renders don't hold its threads.
+    """
+    loop = asyncio.get_running_loop()
+    data = await loop.run_in_executor(
+        None, get_thumbnail_cache().get,
+        image_file.name, size, file_format, get_profile_key(options)
+    )
+    if data is not None:
+        return data, file_format
+    with stage('admission'):
+        admitted = AsyncExitStack()
+        if admission is not None:
+            await admitted.enter_async_context(admission)
+    async with admitted:
+        # Executors don't propagate context variables, so the render runs
+        # in a copy of the request's context to keep its stage timings.
+        return await loop.run_in_executor(
+            get_render_executor(),
+            contextvars.copy_context().run,
+            _render_in_pool, image_file, size, file_format, None, options
+        )
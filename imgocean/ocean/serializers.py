@@ -1,12 +1,21 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from uuid import uuid4
-from PIL import Image as PImage
 from django.conf import settings
+from django.db import transaction
 from django.http import Http404
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
-from .models import Image, User, Size
+from .admission import admit_render
+from .blobs import acquire_blobs, attach_blob, get_digest
+from .const import FORMAT_MAPPER
+from .links import create_signed_link
+from .metadata import get_metadata
+from .models import Image, UploadSession, User, upload_to
+from .rendering import ImageTooLarge, check_pixels, get_or_render_variant
+from .sizes import get_account_heights
 
 
 class SignupSerializer(serializers.ModelSerializer):
@@ -40,6 +49,14 @@ class ImageUploadSerializer(serializers.Serializer):
         max_value=30000,
         required=False
     )
+
+    def validate_img(self, value):
+        # Dimensions come from the header read by the image validation.
+        try:
+            check_pixels(*value.image.size)
+        except ImageTooLarge as e:
+            raise serializers.ValidationError(str(e))
+        return value
         
     def create(self, validated_data):
         owner = validated_data['owner']
@@ -48,34 +65,165 @@ class ImageUploadSerializer(serializers.Serializer):
         if exp_after and not owner.account_type.can_generate_exp_links:
             raise serializers.ValidationError({'exp_after': ['You dont\'t have permissions to create expiring links.']})
         exp_after = timezone.now() + timedelta(seconds=exp_after) if exp_after else None
-        image = Image(owner=owner, img=img, exp_after=exp_after)
+        image = Image(
+            owner=owner,
+            name=upload_to(None, img.name),
+            img=img,
+            exp_after=exp_after,
+            **get_metadata(img)
+        )
         image.full_clean()
-        image.save()
+        with transaction.atomic():
+            attach_blob(image, img)
+            image.save()
         return image
 
 
+class ImageBatchUploadSerializer(serializers.Serializer):
+    exp_after = serializers.IntegerField(
+        min_value=300,
+        max_value=30000,
+        required=False
+    )
+
+    def __validate_file(self, file):
+        serializer = ImageUploadSerializer(data={'img': file})
+        if not serializer.is_valid():
+            return None, None, serializer.errors
+        image = Image(
+            name=upload_to(None, file.name),
+            img=serializer.validated_data['img']
+        )
+        try:
+            image.clean_fields(exclude=['owner', 'exp_after'])
+        except ValidationError as e:
+            return None, None, e.message_dict
+        for name, value in get_metadata(file).items():
+            setattr(image, name, value)
+        # Files are hashed here too, hashlib releases the GIL as well.
+        image.digest = get_digest(file)
+        return image, image.digest, None
+
+    def create(self, validated_data):
+        """
+        Create images of all valid files in a single bulk insert.
+
+        Files are stored once per distinct content, duplicates of
+        already stored content only take a reference to its blob.
+
+        Return list of `(filename, image, errors)` tuples in the order
+        of files, where either image or errors is `None`.
+        """
+        owner = validated_data['owner']
+        files = validated_data['files']
+        exp_after = validated_data.get('exp_after', None)
+        if exp_after and not owner.account_type.can_generate_exp_links:
+            raise serializers.ValidationError({'exp_after': ['You dont\'t have permissions to create expiring links.']})
+        exp_after = timezone.now() + timedelta(seconds=exp_after) if exp_after else None
+        # Pillow releases the GIL while verifying images, so files are
+        # validated in parallel threads.
+        with ThreadPoolExecutor(
+            max_workers=settings.UPLOAD_VALIDATION_WORKERS
+        ) as executor:
+            validated = list(executor.map(self.__validate_file, files))
+        results = []
+        images = []
+        contents = {}
+        for file, (image, digest, errors) in zip(files, validated):
+            if image is not None:
+                image.owner = owner
+                image.exp_after = exp_after
+                images.append((image, digest))
+                # Files of the same content are stored once.
+                _, count = contents.get(digest, (file, 0))
+                contents[digest] = (file, count + 1)
+            results.append((file.name, image, errors))
+        with transaction.atomic():
+            blobs = acquire_blobs(contents)
+            for image, digest in images:
+                image.blob = blobs[digest]
+                image.img = image.blob.name
+            Image.objects.bulk_create([image for image, _ in images])
+        return results
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    exp_after = serializers.IntegerField(
+        min_value=300,
+        max_value=30000,
+        required=False
+    )
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id',
+            'filename',
+            'size',
+            'offset',
+            'exp_after',
+        ]
+        read_only_fields = ['offset']
+
+    def validate_filename(self, value):
+        _, extension = os.path.splitext(value)
+        if extension[1:].lower() not in FORMAT_MAPPER:
+            raise serializers.ValidationError('Allowed formats are [JPG, JPEG, PNG].')
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_SESSION_MAX_BYTES:
+            raise serializers.ValidationError(
+                f'Size should be between 1 and {settings.UPLOAD_SESSION_MAX_BYTES} bytes.'
+            )
+        return value
+
+    def create(self, validated_data):
+        owner = validated_data['owner']
+        if validated_data.get('exp_after') and not owner.account_type.can_generate_exp_links:
+            raise serializers.ValidationError({'exp_after': ['You dont\'t have permissions to create expiring links.']})
+        return super().create(validated_data)
+
+
+class ImageLinkSerializer(serializers.Serializer):
+    size = serializers.IntegerField(min_value=0, required=False, default=0)
+    expires_in = serializers.IntegerField(
+        min_value=300,
+        max_value=30000
+    )
+
+    def create(self, validated_data):
+        owner = validated_data['owner']
+        filename = validated_data['filename']
+        size = validated_data['size']
+        if not owner.account_type.can_generate_exp_links:
+            raise serializers.ValidationError({'expires_in': ['You dont\'t have permissions to create expiring links.']})
+        if not Image.objects.filter(name=filename, owner=owner).exists():
+            raise Http404('Image doesn\'t exist')
+        if size not in get_account_heights(owner.account_type_id):
+            raise serializers.ValidationError({'size': ['Size is not available.']})
+        return create_signed_link(filename, size, validated_data['expires_in'])
+
+
 class ImageDetailSerializer(serializers.Serializer):
     size = serializers.IntegerField(min_value=0, required=False)
 
     def __get_image_object(self, filename):
         try:
-            return Image.objects.get(img=filename)
+            return Image.objects.select_related(
+                'owner__account_type'
+            ).get(name=filename)
         except Image.DoesNotExist:
             raise Http404('Image doesn\'t exist')
     
     def __check_size_exist(self, image, size):
-        try:
-            Size.objects.get(
-                account_type=image.owner.account_type,
-                height=size
-            )
-        except Size.DoesNotExist:
+        if size not in get_account_heights(image.owner.account_type_id):
             raise Http404('Image doesn\'t exist')
 
     def __check_expired_permissions(self, image, user):
         if image.exp_after is None \
             or image.exp_after >= timezone.now() \
-                or (not user.is_anonymous and image.owner == user):
+                or (not user.is_anonymous and image.owner_id == user.pk):
             return True
         raise Http404('Link expired')
 
@@ -87,22 +235,31 @@ class ImageDetailSerializer(serializers.Serializer):
             raise serializers.ValidationError({'size': ['Empty size query.']})
         return value
 
-    def create(self, filename, user):
+    def get_image(self, filename, user, signed=False):
         """
-        Create response image.
+        Return image record and requested size if user can see them.
+
+        Signed links carry their own expiration time, which is verified
+        before the image is looked up, so expiration of the image itself
+        isn't checked for them.
         """
         image_record = self.__get_image_object(filename)
-        size = int(self.initial_data['size']) if self.initial_data else 0
+        size = int(self.initial_data.get('size', 0))
         self.__check_size_exist(
             image_record, size
         )
-        self.__check_expired_permissions(image_record, user)
-        with PImage.open(image_record.img) as img:
-            response_img = img
-            file_format = response_img.format
-            if size:
-                widht, height = response_img.size
-                aspect_ratio = widht / height
-                new_width = int(aspect_ratio * size)
-                response_img = response_img.resize((new_width, size))
-            return response_img.copy(), file_format
\ No newline at end of file
+        if not signed:
+            self.__check_expired_permissions(image_record, user)
+        return image_record, size
+
+    def create(self, image_record, size, file_format=None):
+        """
+        Create response image bytes, rendering them only on cache miss.
+
+        Renders are admitted within the owner's render limits, raising
+        `RenderRejected` when they're exceeded.
+        """
+        return get_or_render_variant(
+            image_record.img, size, file_format,
+            admission=admit_render(image_record)
+        )
@@ -0,0 +1,50 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import get_user_cache
+from .blobs import release_blob
+from .cache import delete_shared_variants, get_thumbnail_cache
+from .metrics import execute_wrapper
+from .models import Account, Image, Size, User
+from .sizes import clear_sizes_cache
+
+
+@receiver(post_delete, sender=Image)
+def delete_cached_variants(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        # Variants are shared by images of the same blob.
+        release_blob(instance)
+        return
+    get_thumbnail_cache().delete(instance.img.name)
+    delete_shared_variants(instance.img.name)
+
+
+@receiver(post_save, sender=Size)
+@receiver(post_delete, sender=Size)
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_sizes_cache(sender, **kwargs):
+    clear_sizes_cache()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    get_user_cache().delete(
+        str(getattr(instance, api_settings.USER_ID_FIELD))
+    )
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_cached_users(sender, **kwargs):
+    # Cached users carry their accounts.
+    get_user_cache().clear()
+
+
+@receiver(connection_created)
+def install_execute_wrapper(sender, connection, **kwargs):
+    # Wrappers outlive reconnects of the same connection.
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
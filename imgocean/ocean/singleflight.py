@@ -0,0 +1,78 @@
+"""
+Coalescing of concurrent work on the same key.
+
+`SingleFlight` makes threads of one process share the result of a call
+in progress, `file_lock` serializes the call across processes of a host.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Platforms without flock() only coalesce work within a process.
+    fcntl = None
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time.
+
+    Threads asking for a key while its call is in progress wait for it
+    and get its result, or its exception, instead of calling again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold exclusive `flock()` of the file, creating it if needed.
+
+    Lock files are never removed, as unlinking a file another process
+    waits on would let a third one lock a new file of the same name.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock.
+        os.close(fd)
@@ -0,0 +1,92 @@
+import threading
+import time
+from django.conf import settings
+from .models import ENCODER_PROFILE_FIELDS, RENDER_LIMIT_FIELDS, Size
+
+_heights = None
+_profiles = None
+_limits = None
+_loaded_at = 0
+_lock = threading.Lock()
+
+
+def _load_sizes():
+    """
+    Load heights and encoder profiles of all accounts.
+
+    Profiles hold only options set on the size or its account, the
+    size's own options taking precedence. Render limits of accounts
+    come along, only accounts with sizes have anything to render.
+    """
+    heights = {}
+    profiles = {}
+    limits = {}
+    count = len(ENCODER_PROFILE_FIELDS)
+    for row in Size.objects.values_list(
+        'account_type_id',
+        'height',
+        *ENCODER_PROFILE_FIELDS,
+        *(f'account_type__{field}' for field in ENCODER_PROFILE_FIELDS),
+        *(f'account_type__{field}' for field in RENDER_LIMIT_FIELDS)
+    ):
+        account_id, height = row[:2]
+        own = row[2:2 + count]
+        inherited = row[2 + count:2 + 2 * count]
+        limits[account_id] = row[2 + 2 * count:]
+        heights.setdefault(account_id, set()).add(height)
+        profiles[account_id, height] = {
+            field: value if value is not None else fallback
+            for field, value, fallback in zip(
+                ENCODER_PROFILE_FIELDS, own, inherited
+            )
+            if value is not None or fallback is not None
+        }
+    heights = {key: frozenset(value) for key, value in heights.items()}
+    return heights, profiles, limits
+
+
+def _get_sizes():
+    global _heights, _profiles, _limits, _loaded_at
+    with _lock:
+        if _heights is None \
+                or time.monotonic() - _loaded_at > settings.SIZES_CACHE_TTL:
+            _heights, _profiles, _limits = _load_sizes()
+            _loaded_at = time.monotonic()
+        return _heights, _profiles, _limits
+
+
+def get_account_heights(account_id):
+    """
+    Return frozenset of heights allowed for the account.
+
+    The whole `Size` table is small, so it's loaded at once and kept in
+    process memory. Signals clear it whenever a size changes in this
+    process, and `SIZES_CACHE_TTL` bounds how long changes made by
+    other processes take to show up.
+    """
+    heights, _, _ = _get_sizes()
+    return heights.get(account_id, frozenset())
+
+
+def get_encoder_profile(account_id, height):
+    """
+    Return encoder options set for the account's size, an empty dict
+    when Pillow defaults should be used.
+    """
+    _, profiles, _ = _get_sizes()
+    return profiles.get((account_id, height), {})
+
+
+def get_render_limits(account_id):
+    """
+    Return `(concurrency, rate, burst)` render limits of the account,
+    `None` for limits it leaves to settings.
+    """
+    _, _, limits = _get_sizes()
+    return limits.get(account_id, (None, None, None))
+
+
+def clear_sizes_cache():
+    global _heights
+    with _lock:
+        _heights = None
@@ -0,0 +1,303 @@
+"""
+S3 compatible storage of images.
+
+It talks to the S3 REST API with the standard library only: requests are
+signed with AWS Signature Version 4 and sent over a pool of keep-alive
+connections, so consecutive requests of one process skip TCP and TLS
+handshakes. Objects are read lazily with ranged GETs and big files are
+written with multipart uploads, so neither needs to fit in memory.
+"""
+import hashlib
+import hmac
+import http.client
+import io
+import queue
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import Storage, get_storage_class
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject
+
+
+class S3Error(Exception):
+    def __init__(self, status, body):
+        super().__init__(f'S3 request failed with status {status}: {body[:200]!r}')
+        self.status = status
+
+
+class ConnectionPool:
+    """
+    Bounded pool of keep-alive HTTP connections to a single host.
+    """
+    def __init__(self, url, max_connections, timeout):
+        parts = urlsplit(url)
+        self.connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        self.host = parts.hostname
+        self.port = parts.port
+        self.netloc = parts.netloc
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_connections)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connection_class(
+                self.host, self.port, timeout=self.timeout
+            )
+
+    def put(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+def _sign(key, msg):
+    return hmac.new(key, msg.encode(), hashlib.sha256).digest()
+
+
+@deconstructible
+class S3Storage(Storage):
+    def __init__(self, endpoint_url=None, bucket=None, access_key=None,
+                 secret_key=None, region=None):
+        self.endpoint_url = (endpoint_url or settings.S3_ENDPOINT_URL).rstrip('/')
+        self.bucket = bucket or settings.S3_BUCKET
+        self.access_key = access_key or settings.S3_ACCESS_KEY_ID
+        self.secret_key = secret_key or settings.S3_SECRET_ACCESS_KEY
+        self.region = region or settings.S3_REGION
+        self.pool = ConnectionPool(
+            self.endpoint_url, settings.S3_MAX_CONNECTIONS, settings.S3_TIMEOUT
+        )
+
+    def _object_path(self, name):
+        return f'/{quote(self.bucket)}/{quote(name)}'
+
+    def _authorization(self, method, path, query, headers, payload_hash):
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date = now.strftime('%Y%m%d')
+        headers['host'] = self.pool.netloc
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        signed_headers = ';'.join(sorted(headers))
+        canonical_request = '\n'.join([
+            method,
+            path,
+            '&'.join(
+                f'{quote(key, safe="")}={quote(value, safe="")}'
+                for key, value in sorted(query.items())
+            ),
+            ''.join(f'{key}:{headers[key].strip()}\n' for key in sorted(headers)),
+            signed_headers,
+            payload_hash,
+        ])
+        scope = f'{date}/{self.region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256',
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        key = _sign(f'AWS4{self.secret_key}'.encode(), date)
+        for part in (self.region, 's3', 'aws4_request'):
+            key = _sign(key, part)
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        return (
+            f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}'
+        )
+
+    def _request(self, method, name, query=None, headers=None, body=b''):
+        """
+        Send signed request and return its status, headers and body.
+        """
+        query = query or {}
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        path = self._object_path(name)
+        headers['authorization'] = self._authorization(
+            method, path, query, headers, hashlib.sha256(body).hexdigest()
+        )
+        url = path
+        if query:
+            url += '?' + '&'.join(
+                f'{quote(key, safe="")}={quote(value, safe="")}' if value else quote(key, safe="")
+                for key, value in query.items()
+            )
+        # A pooled connection might have been closed by the server while
+        # idle, so the request is retried once on a fresh connection.
+        for attempt in range(2):
+            connection = self.pool.get()
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                connection.close()
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self.pool.put(connection)
+            return response.status, response.headers, data
+
+    def _open(self, name, mode='rb'):
+        return File(
+            io.BufferedReader(
+                S3ObjectReader(self, name), settings.S3_READ_CHUNK_SIZE
+            ),
+            name=name
+        )
+
+    def _save(self, name, content):
+        content.seek(0)
+        if content.size is not None \
+                and content.size <= settings.S3_MULTIPART_THRESHOLD:
+            status, _, body = self._request('PUT', name, body=content.read())
+            if status != 200:
+                raise S3Error(status, body)
+            return name
+        self._multipart_upload(name, content)
+        return name
+
+    def _multipart_upload(self, name, content):
+        status, _, body = self._request('POST', name, query={'uploads': ''})
+        if status != 200:
+            raise S3Error(status, body)
+        upload_id = _find_text(body, 'UploadId')
+        parts = []
+        try:
+            for chunk in content.chunks(settings.S3_MULTIPART_CHUNK_SIZE):
+                number = len(parts) + 1
+                status, headers, body = self._request(
+                    'PUT', name,
+                    query={'partNumber': str(number), 'uploadId': upload_id},
+                    body=chunk
+                )
+                if status != 200:
+                    raise S3Error(status, body)
+                parts.append((number, headers['ETag']))
+            complete = ''.join(
+                f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                for number, etag in parts
+            )
+            status, _, body = self._request(
+                'POST', name, query={'uploadId': upload_id},
+                body=f'<CompleteMultipartUpload>{complete}</CompleteMultipartUpload>'.encode()
+            )
+            if status != 200:
+                raise S3Error(status, body)
+        except BaseException:
+            self._request('DELETE', name, query={'uploadId': upload_id})
+            raise
+
+    def _head(self, name):
+        status, headers, body = self._request('HEAD', name)
+        if status == 404:
+            return None
+        if status != 200:
+            raise S3Error(status, body)
+        return headers
+
+    def delete(self, name):
+        status, _, body = self._request('DELETE', name)
+        if status not in (204, 404):
+            raise S3Error(status, body)
+
+    def exists(self, name):
+        return self._head(name) is not None
+
+    def size(self, name):
+        headers = self._head(name)
+        if headers is None:
+            raise FileNotFoundError(name)
+        return int(headers['Content-Length'])
+
+    def listdir(self, path):
+        prefix = path.rstrip('/') + '/' if path else ''
+        directories, files = [], []
+        query = {'list-type': '2', 'prefix': prefix, 'delimiter': '/'}
+        while True:
+            status, _, body = self._request('GET', '', query=query)
+            if status != 200:
+                raise S3Error(status, body)
+            root = ElementTree.fromstring(body)
+            token = None
+            for element in root.iter():
+                tag = element.tag.rsplit('}', 1)[-1]
+                if tag == 'Key':
+                    files.append(element.text[len(prefix):])
+                elif tag == 'Prefix' and element.text != prefix:
+                    directories.append(element.text[len(prefix):].rstrip('/'))
+                elif tag == 'NextContinuationToken':
+                    token = element.text
+            if token is None:
+                return directories, files
+            query['continuation-token'] = token
+
+    def url(self, name):
+        return f'{self.endpoint_url}{self._object_path(name)}'
+
+
+class S3ObjectReader(io.RawIOBase):
+    """
+    Seekable reader fetching object bytes with ranged GET requests.
+    """
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self._size = storage.size(name)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        if self._position >= self._size or not len(buffer):
+            return 0
+        end = min(self._position + len(buffer), self._size) - 1
+        status, _, data = self.storage._request(
+            'GET', self.name, headers={'Range': f'bytes={self._position}-{end}'}
+        )
+        if status not in (200, 206):
+            raise S3Error(status, data)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+def _find_text(body, tag):
+    for element in ElementTree.fromstring(body).iter():
+        if element.tag.rsplit('}', 1)[-1] == tag:
+            return element.text
+    raise S3Error(200, body)
+
+
+class VariantStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = get_storage_class(settings.VARIANT_STORAGE)()
+
+
+variant_storage = VariantStorage()
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from ocean.models import Account, Image, Size, User
+
+TEST_IMAGE_PATH = os.path.join(os.path.dirname(__file__), 'test.jpeg')
+
+
+def read_test_image():
+    with open(TEST_IMAGE_PATH, 'rb') as file:
+        return file.read()
+
+
+def create_user(heights=(200,), username='test', account_name='Basic',
+                **account_fields):
+    """
+    Return user of a new account allowed the thumbnail `heights`.
+    """
+    account_fields.setdefault('can_generate_exp_links', False)
+    account = Account.objects.create(
+        name=account_name, description='', **account_fields
+    )
+    for height in heights:
+        Size.objects.create(account_type=account, height=height)
+    return User.objects.create(
+        account_type=account,
+        password='test',
+        username=username
+    )
+
+
+def create_image(owner, content=None, name='test.jpeg', **fields):
+    """
+    Return saved image of `owner`, the test JPEG by default.
+    """
+    fields.setdefault('exp_after', None)
+    image = Image(owner=owner, **fields)
+    image.img = SimpleUploadedFile(
+        name=name,
+        content=content if content is not None else read_test_image(),
+        content_type='image/jpeg'
+    )
+    image.save()
+    return image
+
+
+class TemporaryStorageMixin:
+    """
+    Keep originals, cached variants and render locks of the test in
+    temporary directories, which are removed after it.
+    """
+    def setUp(self):
+        super().setUp()
+        override = override_settings(
+            MEDIA_ROOT=self.make_temporary_dir(),
+            THUMBNAIL_CACHE_DIR=self.make_temporary_dir(),
+            RENDER_LOCK_DIR=self.make_temporary_dir()
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def make_temporary_dir(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path, ignore_errors=True)
+        return path
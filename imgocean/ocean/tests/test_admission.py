@@ -0,0 +1,174 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from ocean.admission import (
+    AdmissionController, RenderRejected, aadmit_render, admit_render,
+    get_account_limits, get_admission_controller
+)
+from ocean.models import Image
+from ocean.rendering import aget_or_render_variant, get_or_render_variant
+from ocean.tests.base import TemporaryStorageMixin, create_image, create_user
+
+
+class AdmissionControllerTestCase(SimpleTestCase):
+    def test_concurrency(self):
+        controller = AdmissionController(queue_size=0, timeout=1)
+        with controller.admit(1, (1, 0, 1)):
+            with self.assertRaises(RenderRejected) as rejected:
+                with controller.admit(1, (1, 0, 1)):
+                    pass
+            # Other owners have their own limits.
+            with controller.admit(2, (1, 0, 1)):
+                pass
+        self.assertEqual(rejected.exception.get_retry_after(), '1')
+        with controller.admit(1, (1, 0, 1)):
+            pass
+
+    def test_sync_doesnt_wait(self):
+        controller = AdmissionController(queue_size=1, timeout=5)
+        start = time.monotonic()
+        with controller.admit(1, (1, 0, 1)):
+            with self.assertRaises(RenderRejected):
+                with controller.admit(1, (1, 0, 1)):
+                    pass
+        with controller.admit(1, (0, 1, 1)):
+            pass
+        with self.assertRaises(RenderRejected):
+            with controller.admit(1, (0, 1, 1)):
+                pass
+        self.assertLess(time.monotonic() - start, 1)
+
+    async def test_queue(self):
+        controller = AdmissionController(queue_size=1, timeout=5)
+
+        async def admit():
+            async with controller.aadmit(1, (1, 0, 1)):
+                pass
+
+        # Slots are released from render threads as well.
+        with controller.admit(1, (1, 0, 1)):
+            waiting = asyncio.ensure_future(admit())
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiting.done())
+            # The queue of one request is full.
+            with self.assertRaises(RenderRejected):
+                await admit()
+        await asyncio.wait_for(waiting, 1)
+        self.assertFalse(controller._owners[1].waiters)
+
+    async def test_timeout(self):
+        controller = AdmissionController(queue_size=1, timeout=0.1)
+        async with controller.aadmit(1, (1, 0, 1)):
+            with self.assertRaises(RenderRejected):
+                async with controller.aadmit(1, (1, 0, 1)):
+                    pass
+
+    def test_rate(self):
+        controller = AdmissionController(queue_size=0, timeout=1)
+        for _ in range(3):
+            with controller.admit(1, (0, 0.5, 3)):
+                pass
+        with self.assertRaises(RenderRejected) as rejected:
+            with controller.admit(1, (0, 0.5, 3)):
+                pass
+        # The next token comes in about two seconds.
+        self.assertEqual(rejected.exception.get_retry_after(), '2')
+
+    async def test_rate_wait(self):
+        controller = AdmissionController(queue_size=1, timeout=1)
+        async with controller.aadmit(1, (0, 20, 1)):
+            pass
+        # Waits 50ms for the next token.
+        async with controller.aadmit(1, (0, 20, 1)):
+            pass
+
+
+@override_settings(RENDER_ADMISSION_QUEUE=0)
+class AdmissionViewTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user(heights=[200, 100], render_concurrency=1)
+        self.image = create_image(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rejected(self):
+        url = f'/api/images/{self.image.name}'
+        self.assertEqual(self.client.get(url, {'size': 100}).status_code, 200)
+        with admit_render(self.image):
+            response = self.client.get(url, {'size': 200})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            # Cached variants don't need admission.
+            response = self.client.get(url, {'size': 100})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, {'size': 200}).status_code, 200)
+        self.assertEqual(
+            get_admission_controller()._owners[self.user.pk].active, 0
+        )
+
+    def test_rejected_before_coalescing(self):
+        # Duplicate upload of another owner shares the file and variants.
+        other = Image(
+            owner=create_user(username='other', account_name='Other'),
+            img=self.image.img.name
+        )
+        rendering, proceed = threading.Event(), threading.Event()
+
+        def render_variant(*args):
+            rendering.set()
+            proceed.wait(5)
+            return b'variant'
+
+        def render(image, results):
+            # Limits are read here, threads can't see the test's rows.
+            admission = admit_render(image)
+            return threading.Thread(target=lambda: results.append(
+                get_or_render_variant(
+                    image.img, 200, 'JPEG', admission=admission, options={}
+                )
+            ))
+
+        results = []
+        with mock.patch('ocean.rendering.render_variant', render_variant):
+            leader = render(self.image, [])
+            leader.start()
+            self.assertTrue(rendering.wait(5))
+            # The owner's only slot is taken by the render in progress.
+            with self.assertRaises(RenderRejected):
+                get_or_render_variant(
+                    self.image.img, 200, 'JPEG',
+                    admission=admit_render(self.image), options={}
+                )
+            follower = render(other, results)
+            follower.start()
+            proceed.set()
+            leader.join()
+            follower.join()
+        self.assertEqual(results, [(b'variant', 'JPEG')])
+
+    async def test_async_waits_on_loop(self):
+        limits = await sync_to_async(get_account_limits)(
+            self.user.account_type_id
+        )
+        executor = mock.Mock()
+        with self.settings(RENDER_ADMISSION_QUEUE=1), mock.patch(
+            'ocean.rendering.get_render_executor', executor
+        ):
+            with get_admission_controller().admit(self.user.pk, limits):
+                render = asyncio.ensure_future(aget_or_render_variant(
+                    self.image.img, 200, 'JPEG', {},
+                    admission=aadmit_render(self.image, limits)
+                ))
+                await asyncio.sleep(0.1)
+                # The waiting render holds no thread of the render pool.
+                self.assertFalse(render.done())
+                executor.assert_not_called()
+            executor.return_value = None
+            data, file_format = await asyncio.wait_for(render, 5)
+        executor.assert_called_once()
+        self.assertEqual(file_format, 'JPEG')
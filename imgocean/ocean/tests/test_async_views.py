@@ -0,0 +1,120 @@
+import threading
+from unittest import mock
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase
+from django.test.client import AsyncRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from ocean.asgi import ASGIHandler, AsyncFileResponse
+from ocean.async_views import image_detail, image_list
+from ocean.sizes import clear_sizes_cache
+from ocean.tests.base import (
+    TemporaryStorageMixin, create_image, create_user, read_test_image
+)
+
+
+class AsyncImageViewsTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.user = create_user(heights=[200, 0])
+        self.content = read_test_image()
+        self.image = create_image(self.user)
+        self.auth = f'Bearer {AccessToken.for_user(self.user)}'
+
+    async def test_list(self):
+        request = self.factory.get(
+            '/api/async/images/', AUTHORIZATION=self.auth
+        )
+        response = await image_list(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            f'"/api/images/{self.image.img.name}?size=200"',
+            response.content.decode()
+        )
+
+    async def test_list_anonymous(self):
+        response = await image_list(self.factory.get('/api/async/images/'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_detail(self):
+        name = self.image.img.name
+        request = self.factory.get(f'/api/async/images/{name}?size=200')
+        with mock.patch(
+            'ocean.rendering.get_render_executor', return_value=None
+        ) as executor, mock.patch(
+            'ocean.rendering.close_old_connections'
+        ) as close_old_connections:
+            response = await image_detail(request, filename=name)
+            executor.assert_called_once()
+        # Before and after the render job.
+        self.assertEqual(close_old_connections.call_count, 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        etag = response['ETag']
+        request = self.factory.get(
+            f'/api/async/images/{name}?size=200', **{'If-None-Match': etag}
+        )
+        response = await image_detail(request, filename=name)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_detail_sizes_cache_reload(self):
+        # Every lookup reloads the sizes cache, which queries the database.
+        clear_sizes_cache()
+        name = self.image.img.name
+        with self.settings(SIZES_CACHE_TTL=0), mock.patch(
+            'ocean.rendering.get_render_executor', return_value=None
+        ):
+            for query in ('?size=200', '?size=200', ''):
+                request = self.factory.get(
+                    f'/api/async/images/{name}{query}', AUTHORIZATION=self.auth
+                )
+                response = await image_detail(request, filename=name)
+                self.assertEqual(response.status_code, 200)
+                response.close()
+
+    async def test_detail_not_allowed_size(self):
+        name = self.image.img.name
+        request = self.factory.get(f'/api/async/images/{name}?size=400')
+        response = await image_detail(request, filename=name)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_original_off_loop(self):
+        name = self.image.img.name
+        request = self.factory.get(
+            f'/api/async/images/{name}', AUTHORIZATION=self.auth
+        )
+        threads = []
+        storage_open = FileSystemStorage.open
+
+        def open(storage, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return storage_open(storage, *args, **kwargs)
+
+        with mock.patch.object(FileSystemStorage, 'open', open):
+            response = await image_detail(request, filename=name)
+        self.assertIsInstance(response, AsyncFileResponse)
+        self.assertNotIn(threading.get_ident(), threads)
+        self.assertEqual(
+            b''.join([block async for block in response]), self.content
+        )
+        response.close()
+
+    async def test_send_file_response(self):
+        response = AsyncFileResponse(
+            self.image.img.storage.open(self.image.img.name),
+            content_type='image/jpeg'
+        )
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await ASGIHandler().send_response(response, send)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn((b'Content-Type', b'image/jpeg'), messages[0]['headers'])
+        self.assertEqual(
+            b''.join(message.get('body', b'') for message in messages[1:]),
+            self.content
+        )
+        self.assertNotIn('more_body', messages[-1])
+        self.assertTrue(response.file_to_stream.closed)
@@ -0,0 +1,78 @@
+import time
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from ocean.authentication import UserCache, get_user_cache
+from ocean.models import Account, Size, User
+from ocean.sizes import get_account_heights
+
+
+class UserCacheTestCase(TestCase):
+    def test_lru(self):
+        cache = UserCache(2)
+        expires = time.time() + 60
+        cache.set(1, 'first', expires)
+        cache.set(2, 'second', expires)
+        cache.get(1)
+        cache.set(3, 'third', expires)
+        self.assertEqual(cache.get(1), 'first')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(3), 'third')
+
+    def test_expired(self):
+        cache = UserCache(2)
+        cache.set(1, 'first', time.time() - 1)
+        self.assertIsNone(cache.get(1))
+
+
+class CachedJWTAuthenticationTestCase(TestCase):
+    def setUp(self):
+        self.basic = Account.objects.create(
+            name='Basic', description='', can_generate_exp_links=False
+        )
+        Size.objects.create(account_type=self.basic, height=200)
+        self.user = User.objects.create(
+            account_type=self.basic,
+            password='test',
+            username='test'
+        )
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}'
+        )
+        get_account_heights(self.basic.pk)
+
+    def test_cached_user(self):
+        # User with its account, then the page of images.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/images/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/images/').status_code, 200)
+
+    def test_user_changed(self):
+        self.client.get('/api/images/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/images/').status_code, 401)
+
+    def test_user_changed_string_claim(self):
+        # Newer simplejwt versions write the claim as a string.
+        token = AccessToken.for_user(self.user)
+        token['user_id'] = str(self.user.pk)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get('/api/images/').status_code, 200)
+        self.assertIsNotNone(get_user_cache().get(str(self.user.pk)))
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/images/').status_code, 401)
+
+    def test_account_changed(self):
+        self.client.get('/api/images/')
+        self.basic.can_generate_exp_links = True
+        self.basic.save()
+        self.assertIsNone(get_user_cache().get(str(self.user.pk)))
+
+    @override_settings(AUTH_CACHE_TTL=0)
+    def test_ttl(self):
+        self.client.get('/api/images/')
+        self.assertIsNone(get_user_cache().get(str(self.user.pk)))
@@ -0,0 +1,129 @@
+import os
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from rest_framework.test import APIClient
+from ocean.blobs import (
+    acquire_blob, acquire_blobs, get_blob_name, get_digest
+)
+from ocean.cache import get_thumbnail_cache
+from ocean.models import Blob, Image
+from ocean.tests.base import (
+    TemporaryStorageMixin, create_user, read_test_image
+)
+
+
+class BlobTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self):
+        file = SimpleUploadedFile(
+            name='test.jpeg',
+            content=read_test_image(),
+            content_type='image/jpeg'
+        )
+        response = self.client.post(
+            '/api/images/', {'img': file}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 201)
+        return Image.objects.get(
+            name=response.data['th_200_px'].rsplit('/', 1)[-1].split('?')[0]
+        )
+
+    def test_duplicate_upload(self):
+        first = self.upload()
+        second = self.upload()
+        self.assertNotEqual(first.name, second.name)
+        self.assertEqual(first.img.name, second.img.name)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(Blob.objects.get().references, 2)
+        self.assertEqual(
+            (second.width, second.height, second.format, second.digest),
+            (1843, 1036, 'JPEG', first.blob.digest)
+        )
+        self.assertEqual(second.file_size, second.img.size)
+        self.assertEqual(
+            os.listdir(os.path.dirname(first.img.path)),
+            [os.path.basename(first.img.path)]
+        )
+        response = self.client.get(
+            f'/api/images/{second.name}', {'size': 200}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete_duplicate(self):
+        first = self.upload()
+        second = self.upload()
+        self.client.get(f'/api/images/{second.name}', {'size': 200})
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.img.name))
+        self.assertIsNotNone(
+            get_thumbnail_cache().get(second.img.name, 200, 'JPEG')
+        )
+        self.assertEqual(Blob.objects.get().references, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(second.img.name))
+        self.assertIsNone(
+            get_thumbnail_cache().get(second.img.name, 200, 'JPEG')
+        )
+        self.assertFalse(Blob.objects.exists())
+
+    def test_concurrently_stored_blob(self):
+        content = ContentFile(b'content', name='test.jpeg')
+        digest = get_digest(content)
+        stored = []
+
+        def store(name):
+            stored.append(default_storage.save(name, content))
+            # Another upload of the same content commits first.
+            Blob.objects.create(
+                digest=digest, name='blobs/committed.jpeg', references=1
+            )
+            return stored[0]
+
+        blob = acquire_blob(digest, 'test.jpeg', store)
+        self.assertEqual(blob.name, 'blobs/committed.jpeg')
+        self.assertEqual(Blob.objects.get().references, 2)
+        self.assertFalse(default_storage.exists(stored[0]))
+
+    def test_concurrently_stored_blobs(self):
+        first = ContentFile(b'first', name='first.jpeg')
+        second = ContentFile(b'second', name='second.jpeg')
+        first_digest, second_digest = get_digest(first), get_digest(second)
+        save = default_storage.save
+
+        def store(name, content):
+            if content is first:
+                # Another upload of the first content commits first.
+                Blob.objects.create(
+                    digest=first_digest, name='blobs/committed.jpeg',
+                    references=1
+                )
+            return save(name, content)
+
+        with mock.patch.object(default_storage, 'save', store):
+            blobs = acquire_blobs({
+                first_digest: (first, 1), second_digest: (second, 1)
+            })
+        self.assertEqual(blobs[first_digest].name, 'blobs/committed.jpeg')
+        self.assertEqual(blobs[first_digest].references, 1)
+        self.assertEqual(Blob.objects.get(digest=first_digest).references, 2)
+        # The second file was stored once and is kept.
+        second_name = blobs[second_digest].name
+        self.assertTrue(default_storage.exists(second_name))
+        self.assertEqual(
+            sorted(os.listdir(os.path.dirname(default_storage.path(second_name)))),
+            [os.path.basename(second_name)]
+        )
+        first_dir = os.path.dirname(
+            default_storage.path(get_blob_name(first_digest, 'first.jpeg'))
+        )
+        self.assertEqual(os.listdir(first_dir), [])
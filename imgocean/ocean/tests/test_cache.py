@@ -0,0 +1,82 @@
+import os
+from unittest import mock
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from ocean.cache import ThumbnailCache, get_thumbnail_cache
+from ocean.tests.base import TemporaryStorageMixin, create_image, create_user
+from ocean.views import ImageDetailView
+
+
+class ThumbnailCacheTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.location = self.make_temporary_dir()
+        self.cache = ThumbnailCache(self.location, 100)
+
+    def test_get_missing_variant(self):
+        self.assertIsNone(self.cache.get('test.jpeg', 200, 'JPEG'))
+
+    def test_set_and_get_variant(self):
+        self.cache.set('test.jpeg', 200, 'JPEG', b'thumbnail')
+        self.assertEqual(self.cache.get('test.jpeg', 200, 'JPEG'), b'thumbnail')
+        self.assertIsNone(self.cache.get('test.jpeg', 400, 'JPEG'))
+        self.assertIsNone(self.cache.get('test.jpeg', 200, 'PNG'))
+
+    def test_evict_least_recently_used(self):
+        self.cache.set('first.jpeg', 200, 'JPEG', b'a' * 40)
+        self.cache.set('second.jpeg', 200, 'JPEG', b'b' * 40)
+        first = os.path.join(self.location, 'first.jpeg', '200.jpeg')
+        second = os.path.join(self.location, 'second.jpeg', '200.jpeg')
+        os.utime(first, (1, 1))
+        os.utime(second, (2, 2))
+        # Hit on the first variant makes the second one the oldest.
+        self.cache.get('first.jpeg', 200, 'JPEG')
+        self.cache.set('third.jpeg', 200, 'JPEG', b'c' * 40)
+        self.assertIsNotNone(self.cache.get('first.jpeg', 200, 'JPEG'))
+        self.assertIsNone(self.cache.get('second.jpeg', 200, 'JPEG'))
+        self.assertIsNotNone(self.cache.get('third.jpeg', 200, 'JPEG'))
+
+    def test_skip_variant_over_budget(self):
+        self.cache.set('test.jpeg', 200, 'JPEG', b'a' * 101)
+        self.assertIsNone(self.cache.get('test.jpeg', 200, 'JPEG'))
+
+    def test_delete_variants(self):
+        self.cache.set('test.jpeg', 200, 'JPEG', b'a')
+        self.cache.set('test.jpeg', 400, 'JPEG', b'b')
+        self.cache.delete('test.jpeg')
+        self.assertIsNone(self.cache.get('test.jpeg', 200, 'JPEG'))
+        self.assertIsNone(self.cache.get('test.jpeg', 400, 'JPEG'))
+
+    def test_disabled_cache(self):
+        cache = ThumbnailCache(self.location, 0)
+        cache.set('test.jpeg', 200, 'JPEG', b'a')
+        self.assertIsNone(cache.get('test.jpeg', 200, 'JPEG'))
+
+
+class ImageDetailCacheTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.image = create_image(create_user())
+
+    def get_thumbnail(self):
+        request = self.factory.get(
+            f'/api/images/{self.image.img.name}?size=200'
+        )
+        return ImageDetailView.as_view()(request, filename=self.image.img.name)
+
+    def test_repeated_request_uses_cache(self):
+        response = self.get_thumbnail()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        with mock.patch('ocean.rendering.PImage.open') as pillow_open:
+            cached_response = self.get_thumbnail()
+            pillow_open.assert_not_called()
+        self.assertEqual(cached_response.content, response.content)
+
+    def test_delete_image_removes_variants(self):
+        self.get_thumbnail()
+        name = self.image.img.name
+        self.assertIsNotNone(get_thumbnail_cache().get(name, 200, 'JPEG'))
+        self.image.delete()
+        self.assertIsNone(get_thumbnail_cache().get(name, 200, 'JPEG'))
@@ -0,0 +1,119 @@
+import json
+import unittest
+from datetime import timedelta
+from io import StringIO
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from ocean.cache import get_thumbnail_cache
+from ocean.management.commands.benchmark import Command as Benchmark, reset_peak_rss
+from ocean.models import Account, Image, Size
+from ocean.tests.base import (
+    TemporaryStorageMixin, create_user, read_test_image
+)
+
+
+class ReapExpiredImagesTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = create_user(heights=[])
+        now = timezone.now()
+        self.expired = []
+        for index in range(5):
+            image = Image(owner=user, exp_after=now - timedelta(seconds=index + 1))
+            image.img.save(f'{index}.jpeg', ContentFile(b'image'))
+            self.expired.append(image)
+        self.valid = Image(owner=user, exp_after=now + timedelta(seconds=300))
+        self.valid.img.save('valid.jpeg', ContentFile(b'image'))
+        self.permanent = Image(owner=user, exp_after=None)
+        self.permanent.img.save('permanent.jpeg', ContentFile(b'image'))
+
+    def test_reap_expired_images(self):
+        image = self.expired[0]
+        get_thumbnail_cache().set(image.img.name, 200, 'JPEG', b'thumbnail')
+        out = StringIO()
+        call_command('reap_expired_images', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 expired images and 5 files', out.getvalue())
+        self.assertEqual(
+            set(Image.objects.all()), {self.valid, self.permanent}
+        )
+        self.assertFalse(image.img.storage.exists(image.img.name))
+        self.assertTrue(self.valid.img.storage.exists(self.valid.img.name))
+        self.assertIsNone(get_thumbnail_cache().get(image.img.name, 200, 'JPEG'))
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('reap_expired_images', batch_size=2, dry_run=True, stdout=out)
+        self.assertIn('Would delete 5 expired images', out.getvalue())
+        self.assertEqual(Image.objects.count(), 7)
+
+
+class BackfillImageMetadataTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = create_user(heights=[])
+        self.image = Image(owner=user)
+        self.image.img.save('test.jpeg', ContentFile(read_test_image()))
+        self.broken = Image(owner=user)
+        self.broken.img.save('broken.jpeg', ContentFile(b'image'))
+
+    def test_backfill(self):
+        out = StringIO()
+        call_command(
+            'backfill_image_metadata', batch_size=1, stdout=out,
+            stderr=StringIO()
+        )
+        self.assertIn('Updated 1 images, skipped 1', out.getvalue())
+        self.image.refresh_from_db()
+        self.assertEqual(
+            (self.image.width, self.image.height, self.image.format),
+            (1843, 1036, 'JPEG')
+        )
+        self.assertEqual(self.image.file_size, self.image.img.size)
+        self.assertEqual(len(self.image.digest), 64)
+        self.broken.refresh_from_db()
+        self.assertIsNone(self.broken.width)
+
+
+class BenchmarkTestCase(TestCase):
+    def test_benchmark(self):
+        out = StringIO()
+        call_command(
+            'benchmark', iterations=2, resolutions='64x48',
+            list_sizes='3,10', heights='20', stdout=out
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['results']), {
+            'upload_jpg_64x48', 'upload_png_64x48',
+            'original_jpg_64x48', 'original_png_64x48',
+            'thumbnail_cold_jpg_64x48_20px', 'thumbnail_warm_jpg_64x48_20px',
+            'thumbnail_cold_png_64x48_20px', 'thumbnail_warm_png_64x48_20px',
+            'list_3', 'list_10',
+        })
+        result = report['results']['list_10']
+        self.assertEqual(result['requests'], 2)
+        self.assertLessEqual(
+            result['latency_ms']['p50'], result['latency_ms']['max']
+        )
+        self.assertEqual(
+            set(report['definitions']),
+            {'peak_rss_bytes', 'peak_rss_growth_bytes'}
+        )
+        if reset_peak_rss():
+            self.assertGreater(result['peak_rss_bytes'], 0)
+            self.assertGreaterEqual(result['peak_rss_growth_bytes'], 0)
+        # Benchmark data is rolled back.
+        self.assertFalse(Account.objects.exists())
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(Size.objects.exists())
+
+    @unittest.skipUnless(reset_peak_rss(), 'Peak RSS can\'t be reset here.')
+    def test_peak_rss_per_scenario(self):
+        benchmark = Benchmark()
+        benchmark.iterations = 1
+        big = benchmark.measure(lambda index: bytearray(64 * 1024 * 1024))
+        small = benchmark.measure(lambda index: None)
+        self.assertGreater(big['peak_rss_growth_bytes'], 60 * 1024 * 1024)
+        self.assertLess(small['peak_rss_growth_bytes'], 60 * 1024 * 1024)
+        self.assertLess(small['peak_rss_bytes'], big['peak_rss_bytes'])
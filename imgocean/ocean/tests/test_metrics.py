@@ -0,0 +1,106 @@
+import asyncio
+from django.core.handlers.asgi import ASGIHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from ocean.middleware import RequestMetricsMiddleware
+from ocean.metrics import HISTOGRAMS, Histogram
+from ocean.tests.base import TemporaryStorageMixin, create_image, create_user
+
+
+class HistogramTestCase(SimpleTestCase):
+    def test_collect(self):
+        histogram = Histogram('test_seconds', 'Test.', ('stage',), (0.1, 1))
+        histogram.observe(0.05, 'decode')
+        histogram.observe(0.5, 'decode')
+        histogram.observe(5, 'decode')
+        self.assertEqual(histogram.collect(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{stage="decode",le="0.1"} 1',
+            'test_seconds_bucket{stage="decode",le="1"} 2',
+            'test_seconds_bucket{stage="decode",le="+Inf"} 3',
+            'test_seconds_sum{stage="decode"} 5.55',
+            'test_seconds_count{stage="decode"} 3',
+        ])
+
+
+class RequestMetricsTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        self.user = create_user()
+        self.image = create_image(self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing(self):
+        response = self.client.get(
+            f'/api/images/{self.image.img.name}', {'size': 200}
+        )
+        self.assertEqual(response.status_code, 200)
+        stages = [
+            metric.split(';')[0]
+            for metric in response['Server-Timing'].split(', ')
+        ]
+        for name in ['db', 'lookup', 'open', 'decode', 'resize', 'encode', 'total']:
+            self.assertIn(name, stages)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+
+    @override_settings(SERVER_TIMING=True)
+    async def test_server_timing_async(self):
+        response = await self.async_client.get(
+            '/api/async/images/',
+            AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}'
+        )
+        self.assertEqual(response.status_code, 200)
+        # Queries run in `sync_to_async` threads.
+        self.assertRegex(
+            response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d* queries"'
+        )
+
+    def test_async_capable(self):
+        async def get_response(request):
+            pass
+
+        self.assertTrue(asyncio.iscoroutinefunction(
+            RequestMetricsMiddleware(get_response)
+        ))
+        self.assertFalse(asyncio.iscoroutinefunction(
+            RequestMetricsMiddleware(lambda request: None)
+        ))
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    def test_server_timing_disabled(self):
+        response = self.client.get(
+            f'/api/images/{self.image.img.name}', {'size': 200}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_metrics(self):
+        self.client.get(f'/api/images/{self.image.img.name}', {'size': 200})
+        self.client.get(f'/api/images/{self.image.img.name}', {'size': 100})
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        route = 'route="api/images/<str:filename>"'
+        self.assertIn(
+            f'ocean_stage_duration_seconds_count{{{route},stage="resize",size="200"}} 1',
+            content
+        )
+        self.assertIn(
+            f'ocean_request_duration_seconds_count{{{route},method="GET",status="400",size="invalid"}} 1',
+            content
+        )
+        self.assertIn('ocean_request_queries_bucket{', content)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_metrics_disabled(self):
+        self.client.get(f'/api/images/{self.image.img.name}', {'size': 200})
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        for histogram in HISTOGRAMS:
+            self.assertEqual(len(histogram.collect()), 2)
@@ -6,6 +6,7 @@ from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from ocean.models import Account, Image, Size, User
+from ocean.tests.base import TemporaryStorageMixin
 
 
 class AccountTestCase(TestCase):
@@ -98,8 +99,9 @@ class SizeTestCase(TestCase):
         self.assertTrue('CHECK constraint failed' in str(context.exception))
 
 
-class ImageTestCase(TestCase):
+class ImageTestCase(TemporaryStorageMixin, TestCase):
     def setUp(self):
+        super().setUp()
         basic = Account.objects.create(
             name='Basic', description='', can_generate_exp_links=False
         )
@@ -181,4 +183,11 @@ class ImageTestCase(TestCase):
         )
         with self.assertRaises(ValidationError) as context:
             new_image.full_clean()
-        self.assertTrue('Allowed formats are' in str(context.exception))
\ No newline at end of file
+        self.assertTrue('Allowed formats are' in str(context.exception))
+
+    def test_img_name_unique(self):
+        user = User.objects.get(username='test')
+        Image.objects.create(owner=user, img='test.jpeg')
+        with self.assertRaises(IntegrityError) as context:
+            Image.objects.create(owner=user, img='test.jpeg')
+        self.assertTrue('UNIQUE constraint failed' in str(context.exception))
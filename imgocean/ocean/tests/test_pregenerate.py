@@ -0,0 +1,73 @@
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+from ocean.cache import get_thumbnail_cache
+from ocean.models import Image
+from ocean.tests.base import (
+    TemporaryStorageMixin, create_user, read_test_image
+)
+from ocean.pregenerate import render_variants
+from ocean.views import ImageUploadView
+
+
+@override_settings(THUMBNAIL_PREGENERATE_WORKERS=1)
+class PregenerateTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.user = create_user(
+            heights=[0, 200, 400], account_name='Premium'
+        )
+        self.image = SimpleUploadedFile(
+            name='test.jpeg',
+            content=read_test_image(),
+            content_type='image/jpeg'
+        )
+
+    def upload(self):
+        request = self.factory.post(
+            '/api/images/',
+            {
+                'img': self.image,
+            },
+            format='multipart'
+        )
+        force_authenticate(request, user=self.user)
+        return ImageUploadView.as_view()(request)
+
+    def test_upload_queues_thumbnails(self):
+        executor = mock.Mock()
+        with mock.patch(
+            'ocean.pregenerate.get_pregenerate_executor',
+            return_value=executor
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        image = Image.objects.get()
+        executor.submit.assert_called_once_with(
+            render_variants, image.img, [200, 400]
+        )
+
+    @override_settings(THUMBNAIL_PREGENERATE_WORKERS=0)
+    def test_disabled_pregeneration(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(callbacks, [])
+
+    def test_render_variants(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            self.upload()
+        image = Image.objects.get()
+        with mock.patch(
+            'ocean.pregenerate.close_old_connections'
+        ) as close_old_connections:
+            render_variants(image.img, [200, 400])
+        # Before and after the job.
+        self.assertEqual(close_old_connections.call_count, 2)
+        cache = get_thumbnail_cache()
+        for height in (200, 400):
+            self.assertIsNotNone(cache.get(image.img.name, height, 'JPEG'))
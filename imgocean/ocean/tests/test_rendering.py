@@ -0,0 +1,227 @@
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from io import BytesIO
+from unittest import mock
+from PIL import Image as PImage, ImageFile
+from PIL.JpegImagePlugin import JpegImageFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from ocean.models import Image
+from ocean.rendering import (
+    ImageTooLarge, MemoryBudget, accepts_webp, estimate_render_memory,
+    get_encoder_options, get_variant_format, render_variant
+)
+from ocean.tests.base import TemporaryStorageMixin
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Prints growth of the peak RSS of a render in a fresh interpreter, after
+# Pillow plugins are loaded by rendering a tiny image.
+PEAK_RSS_SCRIPT = '''
+import resource, sys
+from io import BytesIO
+import django
+django.setup()
+from PIL import Image as PImage
+from ocean.rendering import render_variant
+path, size, file_format = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+small = BytesIO()
+PImage.new('RGB', (8, 8)).save(small, file_format)
+render_variant(small, 2, file_format)
+with open(path, 'rb') as file:
+    data = file.read()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+render_variant(BytesIO(data), size, file_format)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print((after - before) * 1024)
+'''
+
+
+def create_image(size, file_format):
+    buffer = BytesIO()
+    PImage.new('RGB', size, (120, 30, 200)).save(buffer, file_format)
+    buffer.seek(0)
+    return buffer
+
+
+class RenderVariantTestCase(TestCase):
+    def test_resize_jpeg(self):
+        data = render_variant(create_image((3000, 2000), 'JPEG'), 200, 'JPEG')
+        with PImage.open(BytesIO(data)) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertEqual(img.size, (300, 200))
+
+    def test_resize_png(self):
+        data = render_variant(create_image((900, 600), 'PNG'), 400, 'PNG')
+        with PImage.open(BytesIO(data)) as img:
+            self.assertEqual(img.format, 'PNG')
+            self.assertEqual(img.size, (600, 400))
+
+    def test_original_size(self):
+        data = render_variant(create_image((900, 600), 'PNG'), 0, 'PNG')
+        with PImage.open(BytesIO(data)) as img:
+            self.assertEqual(img.size, (900, 600))
+
+    def test_jpeg_draft_decoding(self):
+        draft = JpegImageFile.draft
+        with mock.patch.object(
+            JpegImageFile, 'draft', autospec=True, side_effect=draft
+        ) as patched_draft:
+            render_variant(create_image((3200, 1600), 'JPEG'), 100, 'JPEG')
+        _, mode, requested_size = patched_draft.call_args.args
+        self.assertEqual(requested_size, (600, 300))
+
+    @override_settings(THUMBNAIL_RESAMPLE='nearest')
+    def test_configured_filter(self):
+        with mock.patch.object(
+            PImage.Image, 'resize', autospec=True,
+            return_value=PImage.new('RGB', (200, 200))
+        ) as resize:
+            render_variant(create_image((400, 400), 'PNG'), 200, 'PNG')
+        self.assertEqual(
+            resize.call_args.kwargs['resample'], PImage.Resampling.NEAREST
+        )
+
+
+class RenderMemoryTestCase(TemporaryStorageMixin, SimpleTestCase):
+    @override_settings(IMAGE_MAX_PIXELS=10000)
+    def test_max_pixels(self):
+        file = create_image((200, 100), 'PNG')
+        with mock.patch.object(ImageFile.ImageFile, 'load') as load:
+            with self.assertRaises(ImageTooLarge):
+                render_variant(file, 50, 'PNG')
+        load.assert_not_called()
+
+    def test_estimate(self):
+        # Reduced by 5 to 600x600, resampled through 200x600 to 200x200.
+        self.assertEqual(
+            estimate_render_memory('RGB', (3000, 3000), (200, 200)),
+            (3000 * 3000 + 600 * 600 + 200 * 600 + 200 * 200) * 4
+        )
+        self.assertEqual(
+            estimate_render_memory('L', (3000, 3000), (2000, 2000)),
+            3000 * 3000 + 2000 * 3000 + 2000 * 2000
+        )
+        self.assertEqual(
+            estimate_render_memory('RGB', (300, 200)), 2 * 300 * 200 * 4
+        )
+
+    def test_budget(self):
+        budget = MemoryBudget(100)
+        reserved = threading.Event()
+
+        def reserve():
+            with budget.reserve(50):
+                reserved.set()
+
+        with budget.reserve(80):
+            thread = threading.Thread(target=reserve)
+            thread.start()
+            self.assertFalse(reserved.wait(0.2))
+        thread.join()
+        self.assertTrue(reserved.is_set())
+        # Renders bigger than the whole budget run alone.
+        with budget.reserve(1000):
+            self.assertEqual(budget.used, 100)
+        self.assertEqual(budget.used, 0)
+
+    @unittest.skipIf(resource is None, 'resource module is not available')
+    def test_peak_rss(self):
+        directory = self.make_temporary_dir()
+        cases = [
+            ('PNG', (3000, 3000), 200),
+            ('PNG', (3000, 3000), 2000),
+            ('JPEG', (3000, 3000), 200),
+        ]
+        for file_format, size, height in cases:
+            path = os.path.join(directory, f'image.{file_format.lower()}')
+            PImage.new('RGB', size, (120, 30, 200)).save(path, file_format)
+            with PImage.open(path) as img:
+                img.draft(None, (height * 3, height * 3))
+                estimate = estimate_render_memory(
+                    img.mode, img.size, (height, height)
+                )
+            output = subprocess.run(
+                [sys.executable, '-c', PEAK_RSS_SCRIPT, path, str(height), file_format],
+                capture_output=True, check=True, text=True
+            ).stdout
+            # Allow for allocator overhead and the encoders' own buffers.
+            self.assertLessEqual(
+                int(output), estimate * 1.1 + 4 * 1024 * 1024,
+                f'{file_format} {size} to {height}px'
+            )
+
+
+class VariantFormatTestCase(TestCase):
+    def test_accepts_webp(self):
+        self.assertTrue(accepts_webp('image/avif,image/webp,*/*;q=0.8'))
+        self.assertTrue(accepts_webp('image/webp;q=0.5'))
+        self.assertFalse(accepts_webp('image/webp;q=0'))
+        self.assertFalse(accepts_webp('image/*,*/*'))
+        self.assertFalse(accepts_webp(''))
+
+    def test_negotiated_format(self):
+        png = Image(img='a.png', format='PNG').img
+        self.assertEqual(get_variant_format(png, 'image/webp'), 'WEBP')
+        self.assertEqual(get_variant_format(png, '*/*'), 'PNG')
+        self.assertEqual(get_variant_format(Image(img='a.jpg').img), 'JPEG')
+
+    def test_format_of_content(self):
+        # Extensions are only used for images without stored format.
+        self.assertEqual(
+            get_variant_format(Image(img='a.jpg', format='PNG').img), 'PNG'
+        )
+        self.assertEqual(
+            get_variant_format(Image(img='a.jpg', format='MPO').img), 'JPEG'
+        )
+
+    @override_settings(THUMBNAIL_WEBP=False)
+    def test_webp_disabled(self):
+        png = Image(img='a.png', format='PNG').img
+        self.assertEqual(get_variant_format(png, 'image/webp'), 'PNG')
+
+    def test_render_webp(self):
+        data = render_variant(create_image((900, 600), 'PNG'), 200, 'WEBP')
+        with PImage.open(BytesIO(data)) as img:
+            self.assertEqual(img.format, 'WEBP')
+            self.assertEqual(img.size, (300, 200))
+
+
+class EncoderOptionsTestCase(TestCase):
+    def test_profile_options(self):
+        profile = {'quality': 60, 'compress_level': 9, 'strip_metadata': True}
+        self.assertEqual(
+            get_encoder_options('JPEG', profile),
+            {'quality': 60, 'strip_metadata': True}
+        )
+        self.assertEqual(
+            get_encoder_options('PNG', profile),
+            {'compress_level': 9, 'strip_metadata': True}
+        )
+        self.assertEqual(get_encoder_options('WEBP', profile)['quality'], 60)
+
+    def test_progressive_jpeg(self):
+        data = render_variant(
+            create_image((900, 600), 'JPEG'), 200, 'JPEG',
+            {'progressive': True, 'optimize': True}
+        )
+        with PImage.open(BytesIO(data)) as img:
+            self.assertTrue(img.info.get('progressive'))
+
+    def test_metadata(self):
+        buffer = BytesIO()
+        exif = PImage.Exif()
+        exif[0x010e] = 'description'
+        PImage.new('RGB', (900, 600)).save(buffer, 'JPEG', exif=exif.tobytes())
+        for strip_metadata, expected in [(False, True), (True, False)]:
+            buffer.seek(0)
+            data = render_variant(
+                buffer, 200, 'JPEG', {'strip_metadata': strip_metadata}
+            )
+            with PImage.open(BytesIO(data)) as img:
+                self.assertEqual('exif' in img.info, expected)
@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from unittest import mock
+from django.test import SimpleTestCase, TestCase
+from ocean import rendering
+from ocean.rendering import get_or_render_variant
+from ocean.singleflight import SingleFlight, file_lock
+from ocean.sizes import get_account_heights
+from ocean.tests.base import TemporaryStorageMixin, create_image, create_user
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+class SingleFlightTestCase(TemporaryStorageMixin, SimpleTestCase):
+    def test_coalesce(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def work():
+            calls.append(1)
+            release.wait()
+            return 'result'
+
+        threads = run_threads(
+            5, lambda: results.append(flight.do('key', work))
+        )
+        # Let all threads join the call in progress.
+        time.sleep(0.2)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['result'] * 5)
+
+    def test_error(self):
+        flight = SingleFlight()
+        with self.assertRaises(ValueError):
+            flight.do('key', int, 'invalid')
+        # Finished calls aren't remembered.
+        self.assertEqual(flight.do('key', int, '1'), 1)
+
+    def test_file_lock(self):
+        path = os.path.join(self.make_temporary_dir(), 'locks', 'test.lock')
+        acquired = threading.Event()
+
+        def lock():
+            with file_lock(path):
+                acquired.set()
+
+        with file_lock(path):
+            threads = run_threads(1, lock)
+            self.assertFalse(acquired.wait(0.2))
+        threads[0].join()
+        self.assertTrue(acquired.is_set())
+
+
+class CoalescedRenderTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = create_image(create_user())
+        # Threads don't query the database, sizes are loaded here.
+        get_account_heights(self.image.owner.account_type_id)
+
+    def test_concurrent_misses(self):
+        release = threading.Event()
+        render_variant = rendering.render_variant
+        results = []
+
+        def slow_render(*args):
+            release.wait()
+            return render_variant(*args)
+
+        with mock.patch.object(
+            rendering, 'render_variant', side_effect=slow_render
+        ) as render:
+            threads = run_threads(4, lambda: results.append(
+                get_or_render_variant(self.image.img, 200)
+            ))
+            time.sleep(0.2)
+            release.set()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(set(results)), 1)
@@ -0,0 +1,190 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock
+from uuid import uuid4
+from PIL import Image as PImage
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, override_settings
+from ocean.cache import (
+    delete_shared_variants, get_shared_variant, set_shared_variant
+)
+from ocean.storage import S3Storage
+
+
+class StandInS3Handler(BaseHTTPRequestHandler):
+    """
+    Minimal in-memory stand-in of the S3 API used by `S3Storage`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def parse(self):
+        url = urlsplit(self.path)
+        _, bucket, key = url.path.split('/', 2)
+        query = parse_qs(url.query, keep_blank_values=True)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append((self.command, key, query, self.headers))
+        return key, {name: values[0] for name, values in query.items()}, body
+
+    def do_HEAD(self):
+        key, _, _ = self.parse()
+        if key not in self.server.objects:
+            return self.send(404)
+        self.send(200, headers={
+            'Content-Length': str(len(self.server.objects[key]))
+        })
+
+    def do_GET(self):
+        key, query, _ = self.parse()
+        if query.get('list-type') == '2':
+            prefix = query['prefix']
+            keys = ''.join(
+                f'<Contents><Key>{name}</Key></Contents>'
+                for name in self.server.objects if name.startswith(prefix)
+            )
+            return self.send(200, f'<ListBucketResult>{keys}</ListBucketResult>'.encode())
+        if key not in self.server.objects:
+            return self.send(404)
+        data = self.server.objects[key]
+        start, end = self.headers['Range'][len('bytes='):].split('-')
+        self.send(206, data[int(start):int(end) + 1])
+
+    def do_PUT(self):
+        key, query, body = self.parse()
+        if 'uploadId' in query:
+            self.server.parts[query['uploadId']][int(query['partNumber'])] = body
+            return self.send(200, headers={'ETag': f'"{query["partNumber"]}"'})
+        self.server.objects[key] = body
+        self.send(200)
+
+    def do_POST(self):
+        key, query, _ = self.parse()
+        if 'uploads' in query:
+            upload_id = str(uuid4())
+            self.server.parts[upload_id] = {}
+            return self.send(200, (
+                '<InitiateMultipartUploadResult>'
+                f'<UploadId>{upload_id}</UploadId>'
+                '</InitiateMultipartUploadResult>'
+            ).encode())
+        parts = self.server.parts.pop(query['uploadId'])
+        self.server.objects[key] = b''.join(
+            parts[number] for number in sorted(parts)
+        )
+        self.send(200, b'<CompleteMultipartUploadResult/>')
+
+    def do_DELETE(self):
+        key, _, _ = self.parse()
+        self.server.objects.pop(key, None)
+        self.send(204)
+
+
+@override_settings(
+    S3_MULTIPART_THRESHOLD=1024,
+    S3_MULTIPART_CHUNK_SIZE=1024,
+    S3_READ_CHUNK_SIZE=512
+)
+class S3StorageTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInS3Handler)
+        self.server.objects = {}
+        self.server.parts = {}
+        self.server.requests = []
+        self.connections = 0
+        get_request = self.server.get_request
+
+        def count_connections():
+            self.connections += 1
+            return get_request()
+
+        self.server.get_request = count_connections
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.storage = S3Storage(
+            endpoint_url=f'http://127.0.0.1:{self.server.server_port}',
+            bucket='ocean',
+            access_key='access',
+            secret_key='secret'
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_save_and_open(self):
+        self.storage.save('small.txt', ContentFile(b'content'))
+        self.assertEqual(self.server.objects['small.txt'], b'content')
+        self.assertTrue(self.storage.exists('small.txt'))
+        self.assertEqual(self.storage.size('small.txt'), 7)
+        with self.storage.open('small.txt') as file:
+            self.assertEqual(file.read(), b'content')
+
+    def test_signed_requests(self):
+        self.storage.save('small.txt', ContentFile(b'content'))
+        _, _, _, headers = self.server.requests[-1]
+        self.assertTrue(headers['Authorization'].startswith(
+            'AWS4-HMAC-SHA256 Credential=access/'
+        ))
+        self.assertIn('x-amz-date', headers['Authorization'])
+
+    def test_multipart_upload(self):
+        content = bytes(range(256)) * 10
+        self.storage.save('big.bin', ContentFile(content))
+        self.assertEqual(self.server.objects['big.bin'], content)
+        part_uploads = [
+            request for request in self.server.requests
+            if request[0] == 'PUT'
+        ]
+        self.assertEqual(len(part_uploads), 3)
+
+    def test_ranged_reads(self):
+        buffer = BytesIO()
+        PImage.new('RGB', (300, 200), (10, 20, 30)).save(buffer, 'PNG')
+        self.server.objects['image.png'] = buffer.getvalue()
+        with self.storage.open('image.png') as file:
+            with PImage.open(file) as img:
+                self.assertEqual(img.size, (300, 200))
+                img.load()
+        ranges = [
+            headers['Range'] for method, _, _, headers in self.server.requests
+            if method == 'GET'
+        ]
+        self.assertTrue(ranges)
+        self.assertTrue(all(range_.startswith('bytes=') for range_ in ranges))
+
+    def test_pooled_connections(self):
+        for index in range(5):
+            self.storage.save(f'{index}.txt', ContentFile(b'content'))
+        self.assertEqual(self.connections, 1)
+
+    def test_delete_and_listdir(self):
+        self.storage.save('variants/a.png/200.png', ContentFile(b'a'))
+        self.storage.save('variants/a.png/400.png', ContentFile(b'b'))
+        _, files = self.storage.listdir('variants/a.png')
+        self.assertEqual(sorted(files), ['200.png', '400.png'])
+        self.storage.delete('variants/a.png/200.png')
+        self.assertFalse(self.storage.exists('variants/a.png/200.png'))
+        with self.assertRaises(FileNotFoundError):
+            self.storage.open('variants/a.png/200.png')
+
+    @override_settings(VARIANT_STORAGE='ocean.storage.S3Storage')
+    def test_shared_variants(self):
+        with mock.patch('ocean.cache.variant_storage', self.storage):
+            self.assertIsNone(get_shared_variant('a.png', 200, 'PNG'))
+            set_shared_variant('a.png', 200, 'PNG', b'variant')
+            self.assertIn('variants/a.png/200.png', self.server.objects)
+            self.assertEqual(get_shared_variant('a.png', 200, 'PNG'), b'variant')
+            delete_shared_variants('a.png')
+            self.assertIsNone(get_shared_variant('a.png', 200, 'PNG'))
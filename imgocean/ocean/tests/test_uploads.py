@@ -0,0 +1,122 @@
+import os
+from io import BytesIO
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+from rest_framework.test import force_authenticate
+from ocean.models import Image, UploadSession
+from ocean.tests.base import (
+    TemporaryStorageMixin, create_user, read_test_image
+)
+from ocean.uploads import append_chunk, get_session_path
+from ocean.views import (
+    UploadSessionView, UploadSessionDetailView, UploadSessionFinalizeView
+)
+
+
+class UploadSessionTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.user = create_user()
+        self.content = read_test_image()
+
+    def create_session(self, **data):
+        data = {'filename': 'test.jpeg', 'size': len(self.content), **data}
+        request = self.factory.post('/api/uploads/', data)
+        force_authenticate(request, user=self.user)
+        return UploadSessionView.as_view()(request)
+
+    def put_chunk(self, session_id, start, chunk, total=None):
+        end = start + len(chunk) - 1
+        request = self.factory.put(
+            f'/api/uploads/{session_id}/',
+            chunk,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{total or len(self.content)}'
+        )
+        force_authenticate(request, user=self.user)
+        return UploadSessionDetailView.as_view()(request, session_id=session_id)
+
+    def finalize(self, session_id):
+        request = self.factory.post(f'/api/uploads/{session_id}/finalize/')
+        force_authenticate(request, user=self.user)
+        return UploadSessionFinalizeView.as_view()(request, session_id=session_id)
+
+    def test_chunked_upload(self):
+        response = self.create_session()
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data['id']
+        chunk_size = len(self.content) // 3 + 1
+        for start in range(0, len(self.content), chunk_size):
+            response = self.put_chunk(
+                session_id, start, self.content[start:start + chunk_size]
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['offset'], len(self.content))
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('th_200_px', response.data)
+        image = Image.objects.get()
+        self.assertEqual(image.img.read(), self.content)
+        image.img.close()
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_resume_with_wrong_offset(self):
+        session_id = self.create_session().data['id']
+        self.put_chunk(session_id, 0, self.content[:100])
+        response = self.put_chunk(session_id, 50, self.content[50:150])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 100)
+
+    def test_missing_part_file(self):
+        # Chunk landing on a node without the session's bytes.
+        session_id = self.create_session().data['id']
+        self.put_chunk(session_id, 0, self.content[:100])
+        os.unlink(get_session_path(UploadSession.objects.get()))
+        response = self.put_chunk(session_id, 100, self.content[100:])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 0)
+        self.assertEqual(UploadSession.objects.get().offset, 0)
+        response = self.put_chunk(session_id, 0, self.content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.finalize(session_id).status_code, 201)
+        image = Image.objects.get()
+        self.assertEqual(image.img.read(), self.content)
+        image.img.close()
+
+    def test_body_read_outside_transaction(self):
+        session_id = self.create_session().data['id']
+        depth = len(connection.savepoint_ids)
+        depths = []
+
+        class Stream(BytesIO):
+            def read(self, size=-1):
+                depths.append(len(connection.savepoint_ids))
+                return super().read(size)
+
+        session = append_chunk(
+            session_id, self.user, f'bytes 0-99/{len(self.content)}',
+            Stream(self.content[:100])
+        )
+        self.assertEqual(session.offset, 100)
+        self.assertEqual(set(depths), {depth})
+
+    def test_finalize_incomplete_upload(self):
+        session_id = self.create_session().data['id']
+        self.put_chunk(session_id, 0, self.content[:100])
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Image.objects.exists())
+
+    def test_finalize_invalid_image(self):
+        session_id = self.create_session(size=100).data['id']
+        self.put_chunk(session_id, 0, b'a' * 100, total=100)
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_session(self):
+        response = self.create_session(filename='test.gif')
+        self.assertEqual(response.status_code, 400)
+        response = self.create_session(exp_after=300)
+        self.assertEqual(response.status_code, 400)
@@ -1,14 +1,27 @@
 import os
 from datetime import timedelta
-from django.test import TestCase
+from io import BytesIO
+from unittest import mock
+from PIL import Image as PImage
+from django.test import TestCase, override_settings
 from django.utils import timezone
+from django.db import connection
 from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import force_authenticate
-from ocean.models import Account, Image, Size, User
-from ocean.views import SignupView, ImageUploadView, ImageDetailView
+from ocean.cache import get_thumbnail_cache
+from ocean.models import Account, Blob, Image, Size, User
+from ocean.rendering import get_encoder_options, get_profile_key
+from ocean.tests.base import (
+    TemporaryStorageMixin, create_image, create_user, read_test_image
+)
+from ocean.views import (
+    SignupView, ImageUploadView, ImageDetailView, ImageLinkView,
+    ImageBatchUploadView
+)
 
 class UserTestCase(TestCase):
     def setUp(self):
@@ -90,8 +103,9 @@ class UserTestCase(TestCase):
         response = SignupView.as_view()(request)
         self.assertEqual(response.status_code, 400)
 
-class ImageTestCase(TestCase):
+class ImageTestCase(TemporaryStorageMixin, TestCase):
     def setUp(self):
+        super().setUp()
         self.factory = APIRequestFactory()
         basic = Account.objects.create(
             name='Basic', description='', can_generate_exp_links=False
@@ -169,6 +183,33 @@ class ImageTestCase(TestCase):
         response = ImageUploadView.as_view()(request)
         self.assertEqual(response.status_code, 201)
     
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_post_image_too_large(self):
+        request = self.factory.post(
+            '/api/images/', {'img': self.image}, format='multipart'
+        )
+        force_authenticate(request, user=self.basic_user)
+        response = ImageUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('img', response.data)
+        self.assertFalse(Image.objects.exists())
+
+    def test_get_image_too_large(self):
+        request = self.factory.post(
+            '/api/images/', {'img': self.image}, format='multipart'
+        )
+        force_authenticate(request, user=self.basic_user)
+        response = ImageUploadView.as_view()(request)
+        name = response.data['th_200_px'].split('?')[0].rsplit('/', 1)[-1]
+        with override_settings(IMAGE_MAX_PIXELS=1000), mock.patch(
+            'ocean.rendering.render_variant'
+        ) as render:
+            request = self.factory.get(f'/api/images/{name}?size=200')
+            force_authenticate(request, user=self.basic_user)
+            response = ImageDetailView.as_view()(request, filename=name)
+        self.assertEqual(response.status_code, 400)
+        render.assert_not_called()
+
     def test_get_image_wrong_size(self):
         request = self.factory.post(
             '/api/images/',
@@ -218,4 +259,392 @@ class ImageTestCase(TestCase):
             f'{image}?size=""'
         )
         img_response = ImageUploadView.as_view()(image_request)
-        self.assertEqual(img_response.status_code, 401)
\ No newline at end of file
+        self.assertEqual(img_response.status_code, 401)
+
+
+class ImageConditionalGetTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.image = create_image(create_user())
+
+    def get_thumbnail(self, **headers):
+        request = self.factory.get(
+            f'/api/images/{self.image.img.name}?size=200', **headers
+        )
+        return ImageDetailView.as_view()(request, filename=self.image.img.name)
+
+    def test_validators_headers(self):
+        response = self.get_thumbnail()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+
+    def test_if_none_match(self):
+        etag = self.get_thumbnail()['ETag']
+        with mock.patch('ocean.rendering.PImage.open') as pillow_open:
+            response = self.get_thumbnail(HTTP_IF_NONE_MATCH=etag)
+            pillow_open.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.get_thumbnail(HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.get_thumbnail()['Last-Modified']
+        response = self.get_thumbnail(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        response = self.get_thumbnail(
+            HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_single_query(self):
+        self.get_thumbnail()
+        with self.assertNumQueries(1):
+            response = self.get_thumbnail()
+        self.assertEqual(response.status_code, 200)
+
+    def test_size_change_invalidates_cache(self):
+        self.get_thumbnail()
+        Size.objects.filter(height=200).delete()
+        self.assertNotEqual(self.get_thumbnail().status_code, 200)
+
+    def test_expired_image_not_revalidated(self):
+        etag = self.get_thumbnail()['ETag']
+        Image.objects.filter(pk=self.image.pk).update(
+            exp_after=timezone.now() - timedelta(seconds=1)
+        )
+        response = self.get_thumbnail(HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response.status_code, 304)
+
+    def test_webp_negotiation(self):
+        jpeg = self.get_thumbnail(HTTP_ACCEPT='image/avif,*/*')
+        webp = self.get_thumbnail(HTTP_ACCEPT='image/avif,image/webp,*/*')
+        self.assertEqual(jpeg['Content-Type'], 'image/jpeg')
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        self.assertEqual(jpeg['Vary'], 'Accept')
+        self.assertEqual(webp['Vary'], 'Accept')
+        self.assertNotEqual(jpeg['ETag'], webp['ETag'])
+        self.assertLess(len(webp.content), len(jpeg.content))
+        cache = get_thumbnail_cache()
+        self.assertIsNotNone(cache.get(self.image.img.name, 200, 'JPEG'))
+        profile = get_profile_key(get_encoder_options('WEBP'))
+        self.assertIsNotNone(
+            cache.get(self.image.img.name, 200, 'WEBP', profile)
+        )
+        response = self.get_thumbnail(
+            HTTP_ACCEPT='image/webp', HTTP_IF_NONE_MATCH=webp['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Vary'], 'Accept')
+
+    def test_encoder_profile(self):
+        default = self.get_thumbnail()
+        Account.objects.filter(name='Basic').update(quality=30)
+        # Updates don't send signals, saving the size does.
+        size = Size.objects.get(height=200)
+        size.progressive = True
+        size.save()
+        tuned = self.get_thumbnail()
+        self.assertNotEqual(default['ETag'], tuned['ETag'])
+        self.assertLess(len(tuned.content), len(default.content))
+        with PImage.open(BytesIO(tuned.content)) as img:
+            self.assertTrue(img.info.get('progressive'))
+
+    @override_settings(THUMBNAIL_WEBP=False)
+    def test_webp_disabled(self):
+        response = self.get_thumbnail(HTTP_ACCEPT='image/webp')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_format_of_content(self):
+        # Transparent PNG named as JPEG can't be encoded as JPEG.
+        buffer = BytesIO()
+        PImage.new('RGBA', (300, 300), (255, 0, 0, 128)).save(buffer, 'PNG')
+        request = self.factory.post('/api/images/', {
+            'img': SimpleUploadedFile(
+                'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+            )
+        }, format='multipart')
+        force_authenticate(request, user=self.image.owner)
+        response = ImageUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        name = response.data['th_200_px'].split('?')[0].rsplit('/', 1)[-1]
+        request = self.factory.get(f'/api/images/{name}?size=200')
+        response = ImageDetailView.as_view()(request, filename=name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+
+class ImageListTestCase(TestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        premium = Account.objects.create(
+            name='Premium', description='', can_generate_exp_links=False
+        )
+        for height in (0, 200, 400):
+            Size.objects.create(
+                account_type=premium, height=height
+            )
+        self.user = User.objects.create(
+            username='test',
+            password='test',
+            is_superuser=False,
+            account_type=premium
+        )
+        created_at = timezone.now()
+        self.images = Image.objects.bulk_create([
+            Image(owner=self.user, name=f'{index}.jpeg', img=f'{index}.jpeg')
+            for index in range(5)
+        ])
+        # Images sharing creation time are ordered by primary key.
+        Image.objects.update(created_at=created_at)
+
+    def get_list(self, url):
+        request = self.factory.get(url)
+        force_authenticate(request, user=self.user)
+        return ImageUploadView.as_view()(request)
+
+    def test_list_pages(self):
+        response = self.get_list('/api/images/?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        names = []
+        while True:
+            names.extend(
+                urls['original'] for urls in response.data['results']
+            )
+            if response.data['next'] is None:
+                break
+            response = self.get_list(response.data['next'])
+        self.assertEqual(
+            names, [f'/api/images/{index}.jpeg' for index in range(5)]
+        )
+
+    def test_list_urls(self):
+        response = self.get_list('/api/images/')
+        self.assertEqual(response.data['results'][0], {
+            'original': '/api/images/0.jpeg',
+            'th_200_px': '/api/images/0.jpeg?size=200',
+            'th_400_px': '/api/images/0.jpeg?size=400',
+        })
+
+    def test_list_query_count(self):
+        with self.assertNumQueries(2):
+            self.get_list('/api/images/?page_size=4')
+        # Sizes are cached after the first request.
+        with self.assertNumQueries(1):
+            self.get_list('/api/images/?page_size=4')
+
+    def test_list_invalid_cursor(self):
+        response = self.get_list('/api/images/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+
+class ImageLinkTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.basic_user = create_user(heights=[])
+        self.enterprise_user = create_user(
+            heights=[0, 200], username='test_2', account_name='Enterprise',
+            can_generate_exp_links=True
+        )
+        self.image = create_image(
+            self.enterprise_user,
+            exp_after=timezone.now() - timedelta(seconds=1)
+        )
+
+    def create_link(self, user, data):
+        name = self.image.img.name
+        request = self.factory.post(f'/api/images/{name}/links/', data)
+        force_authenticate(request, user=user)
+        return ImageLinkView.as_view()(request, filename=name)
+
+    def get_image(self, link):
+        request = self.factory.get(link)
+        return ImageDetailView.as_view()(request, filename=self.image.img.name)
+
+    def test_signed_link(self):
+        response = self.create_link(
+            self.enterprise_user, {'size': 200, 'expires_in': 300}
+        )
+        self.assertEqual(response.status_code, 201)
+        img_response = self.get_image(response.data['link'])
+        self.assertEqual(img_response.status_code, 200)
+        self.assertEqual(img_response['Content-Type'], 'image/jpeg')
+
+    def test_signed_link_to_original(self):
+        response = self.create_link(self.enterprise_user, {'expires_in': 300})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('size=', response.data['link'])
+        img_response = self.get_image(response.data['link'])
+        self.assertEqual(img_response.status_code, 200)
+        self.assertEqual(
+            b''.join(img_response.streaming_content), read_test_image()
+        )
+        img_response.close()
+
+    def test_link_without_permissions(self):
+        response = self.create_link(
+            self.basic_user, {'size': 200, 'expires_in': 300}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_link_not_available_size(self):
+        response = self.create_link(
+            self.enterprise_user, {'size': 400, 'expires_in': 300}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_tampered_link(self):
+        link = self.create_link(
+            self.enterprise_user, {'size': 200, 'expires_in': 300}
+        ).data['link']
+        with self.assertNumQueries(0):
+            response = self.get_image(link.replace('size=200', 'size=400'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_expired_link(self):
+        with mock.patch('ocean.links.time.time', return_value=0):
+            link = self.create_link(
+                self.enterprise_user, {'size': 200, 'expires_in': 300}
+            ).data['link']
+        with self.assertNumQueries(0):
+            response = self.get_image(link)
+        self.assertEqual(response.status_code, 404)
+
+
+class ImageOriginalTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.content = read_test_image()
+        self.image = create_image(
+            create_user(heights=[0], account_name='Premium')
+        )
+
+    def get_original(self):
+        request = self.factory.get(f'/api/images/{self.image.img.name}')
+        return ImageDetailView.as_view()(request, filename=self.image.img.name)
+
+    def test_original_streamed(self):
+        with mock.patch('ocean.rendering.PImage.open') as pillow_open:
+            response = self.get_original()
+            pillow_open.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        response.close()
+
+    @override_settings(IMAGE_SERVE_MODE='x-accel-redirect')
+    def test_original_x_accel_redirect(self):
+        response = self.get_original()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            f'/protected/images/{self.image.img.name}'
+        )
+        self.assertEqual(response.content, b'')
+
+    @override_settings(IMAGE_SERVE_MODE='x-sendfile')
+    def test_original_x_sendfile(self):
+        response = self.get_original()
+        self.assertEqual(response['X-Sendfile'], self.image.img.path)
+
+    def test_original_mpo(self):
+        # Multi-picture JPEGs of cameras are read by Pillow as MPO.
+        buffer = BytesIO()
+        PImage.new('RGB', (300, 300)).save(
+            buffer, 'MPO', save_all=True,
+            append_images=[PImage.new('RGB', (300, 300), 'red')]
+        )
+        request = self.factory.post('/api/images/', {
+            'img': SimpleUploadedFile(
+                'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+            )
+        }, format='multipart')
+        force_authenticate(request, user=self.image.owner)
+        response = ImageUploadView.as_view()(request)
+        self.assertEqual(response.status_code, 201)
+        name = response.data['original'].rsplit('/', 1)[-1]
+        self.assertEqual(Image.objects.get(name=name).format, 'MPO')
+        request = self.factory.get(f'/api/images/{name}')
+        response = ImageDetailView.as_view()(request, filename=name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(
+            b''.join(response.streaming_content), buffer.getvalue()
+        )
+        response.close()
+
+
+class ImageBatchUploadTestCase(TemporaryStorageMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = APIRequestFactory()
+        self.user = create_user()
+
+    def get_file(self, name, content_type='image/jpeg'):
+        _, extension = os.path.splitext(name)
+        image_path = os.path.join(os.getcwd(), f'ocean/tests/test{extension}')
+        return SimpleUploadedFile(
+            name=name,
+            content=open(image_path, 'rb').read(),
+            content_type=content_type
+        )
+
+    def upload(self, data):
+        request = self.factory.post(
+            '/api/images/batch/', data, format='multipart'
+        )
+        force_authenticate(request, user=self.user)
+        return ImageBatchUploadView.as_view()(request)
+
+    def test_batch_upload(self):
+        files = [self.get_file(f'{index}.jpeg') for index in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload({'img': files})
+        inserts = [
+            query for query in queries.captured_queries
+            if query['sql'].startswith('INSERT INTO "ocean_image"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Image.objects.count(), 3)
+        # Files of the same content are stored once.
+        blob = Blob.objects.get()
+        self.assertEqual(blob.references, 3)
+        self.assertEqual(
+            [image['file'] for image in response.data],
+            ['0.jpeg', '1.jpeg', '2.jpeg']
+        )
+        names = set(Image.objects.values_list('name', flat=True))
+        for image in response.data:
+            link = image['urls']['th_200_px']
+            self.assertIn(link[len('/api/images/'):].split('?')[0], names)
+
+    def test_batch_upload_errors(self):
+        response = self.upload({
+            'img': [
+                self.get_file('test.jpeg'),
+                self.get_file('test.txt', 'text/plain'),
+                self.get_file('test.gif', 'image/gif'),
+            ]
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Image.objects.count(), 1)
+        self.assertIn('urls', response.data[0])
+        self.assertIn('img', response.data[1]['errors'])
+        self.assertIn('img', response.data[2]['errors'])
+
+    def test_batch_upload_without_files(self):
+        response = self.upload({})
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_upload_exp_after_permissions(self):
+        response = self.upload({
+            'img': [self.get_file('test.jpeg')],
+            'exp_after': 300
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Image.objects.count(), 0)
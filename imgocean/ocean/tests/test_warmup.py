@@ -0,0 +1,35 @@
+from unittest import mock
+from django.db import OperationalError
+from django.test import TestCase
+from ocean.models import Account, Size
+from ocean.sizes import clear_sizes_cache, get_account_heights
+from ocean.warmup import warm_up_process, warm_up_worker
+
+
+class WarmUpTestCase(TestCase):
+    def setUp(self):
+        self.basic = Account.objects.create(
+            name='Basic', description='', can_generate_exp_links=False
+        )
+        Size.objects.create(account_type=self.basic, height=200)
+
+    def test_warm_up(self):
+        clear_sizes_cache()
+        warm_up_process()
+        warm_up_worker()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_account_heights(self.basic.pk), {200})
+
+    def test_ready(self):
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ready'})
+
+    def test_not_ready(self):
+        with mock.patch(
+            'ocean.views.warm_up_worker',
+            side_effect=OperationalError('connection refused')
+        ):
+            response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'unavailable')
@@ -0,0 +1,188 @@
+import os
+import re
+from datetime import timedelta
+from PIL import Image as PImage
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from .blobs import acquire_blob, get_digest
+from .metadata import get_metadata
+from .models import Image, UploadSession, upload_to
+from .rendering import ImageTooLarge, check_pixels
+from .singleflight import file_lock
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    pass
+
+
+def get_session_path(session):
+    """
+    Return path the session's bytes are appended to.
+
+    Partial files are kept on local disk under `MEDIA_ROOT`, so that
+    with local image storage finalized uploads are moved into place with
+    a rename, not a copy.
+    """
+    return os.path.join(
+        settings.MEDIA_ROOT, settings.UPLOAD_SESSION_DIR, f'{session.pk}.part'
+    )
+
+
+def store_session_file(path, name):
+    """
+    Move complete upload to the image storage under `name`.
+    """
+    try:
+        target = default_storage.path(name)
+    except NotImplementedError:
+        # Remote storage, the file is streamed from disk by the storage.
+        with open(path, 'rb') as part:
+            name = default_storage.save(name, File(part))
+        os.unlink(path)
+        return name
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+    return name
+
+
+def parse_content_range(header):
+    """
+    Return `(start, end)` of `bytes start-end/total` range header.
+    """
+    match = CONTENT_RANGE_RE.match(header or '')
+    if match is None:
+        raise UploadError('Invalid Content-Range header.')
+    start, end = int(match.group(1)), int(match.group(2))
+    if end < start:
+        raise UploadError('Invalid Content-Range header.')
+    return start, end
+
+
+def set_offset(session, offset):
+    """
+    Move session offset from the value read to `offset`.
+
+    The update is conditional, so offsets changed in the meantime, e.g.
+    by another node, aren't overwritten.
+    """
+    updated = UploadSession.objects.filter(
+        pk=session.pk, offset=session.offset
+    ).update(offset=offset)
+    if not updated:
+        session.refresh_from_db(fields=['offset'])
+        raise OffsetMismatch(session.offset)
+    session.offset = offset
+
+
+def append_chunk(session_id, owner, content_range, stream):
+    """
+    Write the byte range read from `stream` at the end of the session.
+
+    The body is copied in fixed-size pieces, so memory used by a chunk
+    doesn't depend on its length. Bytes received before the client went
+    away are kept, and the returned session offset tells where to resume.
+
+    No transaction is held while the body is received. Chunks of the
+    session are serialized by the lock of its part file and the offset
+    is moved with a conditional update once the bytes are written. Part
+    files are local to the node, so a chunk finding fewer bytes than the
+    offset, because they were cleaned up or are on another node, resets
+    the session to the bytes present, which the client resumes from.
+    """
+    start, end = parse_content_range(content_range)
+    length = end - start + 1
+    if length > settings.UPLOAD_SESSION_MAX_CHUNK:
+        raise UploadError('Chunk is too big.')
+    session = UploadSession.objects.get(pk=session_id, owner=owner)
+    path = get_session_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Unlike render locks, the part file is removed once the session
+    # ends, chunks waiting on it then find the session gone or complete.
+    with file_lock(path):
+        session.refresh_from_db(fields=['offset'])
+        if start != session.offset:
+            raise OffsetMismatch(session.offset)
+        if end >= session.size:
+            raise UploadError('Chunk exceeds declared upload size.')
+        with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as part:
+            stored = part.seek(0, os.SEEK_END)
+            if stored < session.offset:
+                set_offset(session, stored)
+                raise OffsetMismatch(stored)
+            part.seek(session.offset)
+            part.truncate()
+            remaining = length
+            while remaining:
+                data = stream.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                part.write(data)
+                remaining -= len(data)
+        set_offset(session, session.offset + length - remaining)
+    return session
+
+
+def finalize_session(session_id, owner):
+    """
+    Verify the uploaded file and turn the session into an `Image`.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(
+            pk=session_id, owner=owner
+        )
+        if session.offset != session.size:
+            raise UploadError('Upload is not complete.')
+        path = get_session_path(session)
+        try:
+            # verify() checks file structure without decoding pixels.
+            with PImage.open(path) as img:
+                img.verify()
+        except Exception:
+            raise UploadError('Upload a valid image.')
+        exp_after = (
+            timezone.now() + timedelta(seconds=session.exp_after)
+            if session.exp_after else None
+        )
+        with open(path, 'rb') as part:
+            digest = get_digest(part)
+            metadata = get_metadata(part)
+        try:
+            check_pixels(metadata['width'], metadata['height'])
+        except ImageTooLarge as e:
+            raise UploadError(str(e))
+        image = Image(
+            owner=owner,
+            name=upload_to(None, session.filename),
+            exp_after=exp_after,
+            digest=digest,
+            **metadata
+        )
+        image.blob = acquire_blob(
+            digest, session.filename,
+            lambda name: store_session_file(path, name)
+        )
+        image.img.name = image.blob.name
+        image.save()
+        session.delete()
+    if os.path.exists(path):
+        # Content was stored already, the upload isn't needed.
+        os.unlink(path)
+    return image
+
+
+def delete_session(session):
+    try:
+        os.unlink(get_session_path(session))
+    except FileNotFoundError:
+        pass
+    session.delete()
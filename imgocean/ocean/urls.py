@@ -3,12 +3,27 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from .views import ImageUploadView, SignupView, ImageDetailView
+from . import async_views
+from .views import (
+    ImageUploadView, SignupView, ImageDetailView, ImageLinkView,
+    ImageBatchUploadView, UploadSessionView, UploadSessionDetailView,
+    UploadSessionFinalizeView
+)
 urlpatterns = [
     path('signup/', SignupView.as_view()),
     path('login/', TokenObtainPairView.as_view()),
     path('token/refresh/', TokenRefreshView.as_view()),
     path('images/', ImageUploadView.as_view()),
+    path('images/batch/', ImageBatchUploadView.as_view()),
     path('images/<str:filename>', ImageDetailView.as_view()),
+    path('images/<str:filename>/links/', ImageLinkView.as_view()),
+    path('uploads/', UploadSessionView.as_view()),
+    path('uploads/<uuid:session_id>/', UploadSessionDetailView.as_view()),
+    path(
+        'uploads/<uuid:session_id>/finalize/',
+        UploadSessionFinalizeView.as_view()
+    ),
+    path('async/images/', async_views.image_list),
+    path('async/images/<str:filename>', async_views.image_detail),
     
 ]
\ No newline at end of file
@@ -1,14 +1,32 @@
-from django.http import HttpResponse
+from io import BytesIO
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
 from django.core.exceptions import ValidationError
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from .const import EXTENSION_MAPPER
-from .models import Image, Size
+from .admission import RenderRejected
+from .delivery import (
+    get_original_response, get_response_format, get_validators,
+    get_variant_response, set_validators
+)
+from .links import ExpiredLink, InvalidLink, verify_link
+from .metrics import export_metrics, stage
+from .models import Image, UploadSession
+from .pagination import ImageKeysetPagination
+from .pregenerate import pregenerate_variants
 from .serializers import (
-    ImageDetailSerializer, ImageUploadSerializer, SignupSerializer
+    ImageBatchUploadSerializer, ImageDetailSerializer, ImageLinkSerializer,
+    ImageUploadSerializer, SignupSerializer, UploadSessionSerializer
+)
+from .sizes import get_account_heights
+from .uploads import (
+    OffsetMismatch, UploadError, append_chunk, delete_session, finalize_session
 )
+from .warmup import warm_up_worker
 
 class SignupView(APIView):
     """
@@ -28,51 +46,279 @@ class SignupView(APIView):
         )
 
 
+def get_sizes(user):
+    return sorted(get_account_heights(user.account_type_id))
+
+
+def get_image_urls(image, sizes):
+    urls = {}
+    for height in sizes:
+        link = f"/api/images/{image.name}"
+        if height != 0:
+            urls[f'th_{height}_px'] = f"{link}?size={height}"
+        else:
+            urls[f'original'] = link
+    return urls
+
+
 class ImageUploadView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def __get_image_urls(self, image, user):
-        sizes = Size.objects.filter(account_type=user.account_type)
-        urls = {}
-        for size in sizes:
-            link = f"/api/images/{image.img.name}"
-            if size.height != 0:
-                urls[f'th_{size.height}_px'] = f"{link}?size={size.height}"
-            else:
-                urls[f'original'] = link
-        return urls
-
     def get(self, request, format=None):
-        images = Image.objects.filter(owner=request.user)
-        sizes = Size.objects.filter(account_type=request.user.account_type)
+        images = Image.objects.filter(owner=request.user).only(
+            'id', 'name', 'created_at'
+        )
+        sizes = get_sizes(request.user)
+        paginator = ImageKeysetPagination()
+        page = paginator.paginate_queryset(images, request, view=self)
         images_list = [
-            self.__get_image_urls(image, request.user)
-            for image in images
-        ]   
-        return Response(images_list, status=status.HTTP_200_OK)
+            get_image_urls(image, sizes)
+            for image in page
+        ]
+        return paginator.get_paginated_response(images_list)
         
     def post(self, request, format=None):
         serializer = ImageUploadSerializer(data=request.data)
         if serializer.is_valid():
             try:
                 image = serializer.save(owner=request.user)
-                images = self.__get_image_urls(image, request.user)
+                pregenerate_variants(image)
+                images = get_image_urls(
+                    image, get_sizes(request.user)
+                )
                 return Response(images, status=status.HTTP_201_CREATED)
             except ValidationError as e:
                 return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
+class ImageBatchUploadView(APIView):
+    """
+    API endpoint that allows to upload many images in one request.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        files = request.FILES.getlist('img')
+        if not files:
+            return Response(
+                {'img': ['No file was submitted.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(files) > settings.UPLOAD_BATCH_MAX_FILES:
+            return Response(
+                {'img': [f'Up to {settings.UPLOAD_BATCH_MAX_FILES} files can be uploaded at once.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = ImageBatchUploadSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                results = serializer.save(owner=request.user, files=files)
+            except ValidationError as e:
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            sizes = get_sizes(request.user)
+            images = []
+            for filename, image, errors in results:
+                if image is None:
+                    images.append({'file': filename, 'errors': errors})
+                    continue
+                pregenerate_variants(image)
+                images.append({
+                    'file': filename,
+                    'urls': get_image_urls(image, sizes),
+                })
+            created = any(image is not None for _, image, _ in results)
+            return Response(
+                images,
+                status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadSessionView(APIView):
+    """
+    API endpoint that allows to start resumable uploads.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, format=None):
+        serializer = UploadSessionSerializer(data=request.data)
+        if serializer.is_valid():
+            serializer.save(owner=request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadSessionDetailView(APIView):
+    """
+    API endpoint that allows to send byte ranges of resumable uploads.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def __get_session(self, request, session_id):
+        try:
+            return UploadSession.objects.get(pk=session_id, owner=request.user)
+        except UploadSession.DoesNotExist:
+            raise Http404('Upload doesn\'t exist')
+
+    def get(self, request, session_id, format=None):
+        session = self.__get_session(request, session_id)
+        return Response(UploadSessionSerializer(session).data)
+
+    def put(self, request, session_id, format=None):
+        # Body is read from the request stream, so it's neither parsed
+        # nor buffered by upload handlers.
+        try:
+            session = append_chunk(
+                session_id,
+                request.user,
+                request.META.get('HTTP_CONTENT_RANGE'),
+                request.stream or BytesIO()
+            )
+        except UploadSession.DoesNotExist:
+            raise Http404('Upload doesn\'t exist')
+        except OffsetMismatch as e:
+            return Response(
+                {'offset': e.args[0]}, status=status.HTTP_409_CONFLICT
+            )
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, session_id, format=None):
+        delete_session(self.__get_session(request, session_id))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionFinalizeView(APIView):
+    """
+    API endpoint that allows to turn complete uploads into images.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, session_id, format=None):
+        try:
+            image = finalize_session(session_id, request.user)
+        except UploadSession.DoesNotExist:
+            raise Http404('Upload doesn\'t exist')
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except ValidationError as e:
+            return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+        pregenerate_variants(image)
+        images = get_image_urls(image, get_sizes(request.user))
+        return Response(images, status=status.HTTP_201_CREATED)
+
+
+class ImageLinkView(APIView):
+    """
+    API endpoint that allows to create signed expiring links to images.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, filename, format=None):
+        serializer = ImageLinkSerializer(data=request.data)
+        if serializer.is_valid():
+            link = serializer.save(owner=request.user, filename=filename)
+            return Response({'link': link}, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ImageDetailView(APIView):    
+    def perform_content_negotiation(self, request, force=False):
+        # Accept header negotiates the image format, so errors fall back
+        # to the default renderer instead of failing with 406.
+        return super().perform_content_negotiation(request, force=True)
+
+    def __verify_signature(self, request, filename):
+        params = request.query_params
+        try:
+            verify_link(
+                filename,
+                params.get('size', '0'),
+                params.get('expires'),
+                params['signature']
+            )
+        except InvalidLink as e:
+            return Response({'error': str(e)}, status=status.HTTP_403_FORBIDDEN)
+        except ExpiredLink as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return None
+
     def get(self, request, filename, format=None):
+        # Signed links are rejected before the database or file is touched.
+        signed = 'signature' in request.query_params
+        if signed:
+            response = self.__verify_signature(request, filename)
+            if response is not None:
+                return response
         query_serializer = ImageDetailSerializer(data=request.query_params)
         if query_serializer.is_valid():
             query_serializer.validate_size(query_serializer.data)
             try:
-                response_img, file_format = query_serializer.create(filename, request.user)
-                response = HttpResponse(content_type=EXTENSION_MAPPER[file_format.lower()])
-                response_img.save(response, file_format)  
-                return response
+                with stage('lookup'):
+                    image_record, size = query_serializer.get_image(
+                        filename, request.user, signed=signed
+                    )
+                # Permissions are checked before the original is opened,
+                # so revalidating a cached image costs no rendering.
+                file_format = get_response_format(request, image_record, size)
+                etag, last_modified = get_validators(
+                    image_record, size, file_format
+                )
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=last_modified
+                )
+                if response is None and not size:
+                    response = get_original_response(image_record.img)
+                elif response is None:
+                    data, file_format = query_serializer.create(
+                        image_record, size, file_format
+                    )
+                    response = get_variant_response(data, file_format)
+                if size:
+                    patch_vary_headers(response, ['Accept'])
+                return set_validators(response, etag, last_modified)
+            except RenderRejected as e:
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={'Retry-After': e.get_retry_after()}
+                )
             except Exception as e:
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(query_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ReadinessView(APIView):
+    """
+    API endpoint telling load balancers whether the worker can serve.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request, format=None):
+        try:
+            # Cheap once the worker is warm, otherwise it warms it up.
+            warm_up_worker()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError as e:
+            return Response(
+                {'status': 'unavailable', 'error': str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response({'status': 'ready'})
+
+
+class MetricsView(APIView):
+    """
+    API endpoint exposing request histograms in Prometheus text format.
+    """
+    def get(self, request, format=None):
+        if not settings.METRICS_ENABLED:
+            raise Http404
+        return HttpResponse(
+            export_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
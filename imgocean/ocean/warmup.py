@@ -0,0 +1,45 @@
+"""
+Warm-up of serving processes, so that the first requests after a deploy
+don't pay for lazy initialization.
+"""
+from PIL import Image as PImage
+from django.db import connection, connections
+from django.urls import URLResolver, get_resolver
+from .rendering import webp_supported
+from .sizes import get_account_heights
+
+
+def compile_url_patterns(resolver=None):
+    """
+    Import all URL configurations and compile their patterns.
+    """
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        # Regular expressions are compiled on first access.
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            compile_url_patterns(pattern)
+
+
+def warm_up_process():
+    """
+    Load what forked workers can share: Pillow plugins, which are
+    otherwise imported by the first opened image, and URL patterns.
+
+    Database connections must not be shared with forked processes, so
+    any opened on the way are closed.
+    """
+    PImage.init()
+    webp_supported()
+    compile_url_patterns()
+    connections.close_all()
+
+
+def warm_up_worker():
+    """
+    Open the worker's database connection and load the cached `Size`
+    and `Account` tables.
+    """
+    connection.ensure_connection()
+    # Any account loads the whole table.
+    get_account_heights(None)